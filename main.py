@@ -1,20 +1,37 @@
 # %%
 # Exporting funcitons to work
 from scripts.process_images import annotate_images, draw_bounding_boxes_on_images
+from scripts.mask_store import build_mask_store
 from scripts.manage_data import (
     copy_images,
-    count_lines_in_file,
-    rename_files,
+    build_dataset_index,
+    rename_indexed_files,
     split_data,
     create_yaml_file,
-    count_files,
+    report_duplicates,
 )
-from scripts.yolo_utils import (
-    train_model,
-    export_model,
-    make_predicts,
+from scripts.dataset_stats import print_stats_table
+from scripts.augmentation_bank import (
+    build_augmentation_bank,
+    create_bank_yaml,
+    benchmark_augmentation_bank,
+)
+from scripts.predict_pipeline import predict_pipelined
+from scripts.export_pipeline import export_models
+from scripts.quantize_model import quantize_model
+from scripts.image_size_sweep import sweep_image_sizes
+from scripts.distillation import distill_model, compare_student_teacher
+from scripts.pruning import prune_and_finetune
+from scripts.evalute_datasets import evalute_predictions, evaluate_with_masks
+from scripts.cross_evaluation import cross_evaluate
+from scripts.realtime_replay import replay_report
+from scripts.render_images import render_dataset
+from scripts.blob_store import collect_garbage, report_storage
+from scripts.train_queue import (
+    add_training_jobs,
+    create_training_job,
+    run_training_queue,
 )
-from scripts.evalute_datasets import evalute_predictions
 import os
 
 # %%
@@ -22,6 +39,7 @@ import os
 BASE_PATH = os.getcwd()
 PATH_RAW = "data/raw"
 PATH_CLEAN = "data/clean"
+BLOB_STORE = "data/blobs"
 BASE_PATH_YAML = "configs"
 BASE_PATH_MODEL = "runs"
 TRAIN_PATH = "train"
@@ -42,18 +60,26 @@ for dataset in [
     "kvasir_seg",
     "sessile_main_kvasir_seg",
 ]:
-    # Designated paths of data to process raw data
+    # Designated paths of data to process raw data, they can also be folders inside
+    # the downloaded zip archives, e.g. f"{PATH_RAW}/kvasir-seg.zip/Kvasir-SEG/images"
     IMAGES_FOLDER = f"{PATH_RAW}/{dataset}/images"
     MASKS_FOLDER = f"{PATH_RAW}/{dataset}/masks"
     # Output paths
     OUTPUT_IMAGES_FOLDER = f"{PATH_CLEAN}/{dataset}/images"
     OUTPUT_MASKS_FOLDER = f"{PATH_CLEAN}/{dataset}/masks"
 
-    # Copy images and masks to the output folder
-    copy_images(IMAGES_FOLDER, OUTPUT_IMAGES_FOLDER)
-    copy_images(MASKS_FOLDER, OUTPUT_MASKS_FOLDER)
+    # Copy images and masks to the output folder through the blob store
+    copy_images(IMAGES_FOLDER, OUTPUT_IMAGES_FOLDER, BLOB_STORE)
+    copy_images(MASKS_FOLDER, OUTPUT_MASKS_FOLDER, BLOB_STORE)
+
+# %%
+# Remove blobs no longer used by the clean datasets and report the space saved
+collect_garbage(BLOB_STORE, [PATH_CLEAN])
+report_storage(BLOB_STORE, [PATH_CLEAN])
 
 # %%
+# Index of every dataset, built once and passed to the next stages
+indexes = {}
 for dataset in [
     "cvc_clinic_db",
     "cvc_colon_db",
@@ -66,12 +92,16 @@ for dataset in [
     OUTPUT_LABELS_FOLDER = f"{PATH_CLEAN}/{dataset}/labels"
     OUTPUT_MASKS_FOLDER = f"{PATH_CLEAN}/{dataset}/masks"
 
-    # Process images and masks to create labels
+    # Index images and masks by stem, flagging orphans, empty masks and unreadable files
+    indexes[dataset] = build_dataset_index(OUTPUT_IMAGES_FOLDER, OUTPUT_MASKS_FOLDER)
+
+    # Process images and masks to create labels, added to the index
     annotate_images(
         OUTPUT_IMAGES_FOLDER,
         OUTPUT_MASKS_FOLDER,
         OUTPUT_LABELS_FOLDER,
         CLASS_INDEX,
+        index=indexes[dataset],
     )
 
 # %%
@@ -83,14 +113,15 @@ for dataset in [
     "sessile_main_kvasir_seg",
 ]:
     # Output paths
-    OUTPUT_IMAGES_FOLDER = f"{PATH_CLEAN}/{dataset}/images"
-    OUTPUT_LABELS_FOLDER = f"{PATH_CLEAN}/{dataset}/labels"
     OUTPUT_MASKS_FOLDER = f"{PATH_CLEAN}/{dataset}/masks"
 
-    # Rename images, masks, and labels
-    rename_files(OUTPUT_IMAGES_FOLDER, PREFIX_IMAGE)
-    rename_files(OUTPUT_LABELS_FOLDER, PREFIX_IMAGE)
-    rename_files(OUTPUT_MASKS_FOLDER, PREFIX_IMAGE)
+    # Rename images, masks, and labels by stem so they keep their pairs
+    indexes[dataset] = rename_indexed_files(
+        indexes[dataset], PREFIX_IMAGE, f"{PATH_CLEAN}/{dataset}/index.json"
+    )
+
+    # Pack the renamed masks in a single memory-mapped file
+    build_mask_store(OUTPUT_MASKS_FOLDER, f"{PATH_CLEAN}/{dataset}/masks.mstore")
 
 # %%
 for dataset in [
@@ -102,14 +133,29 @@ for dataset in [
 ]:
     # Output paths
     OUTPUT_IMAGES_FOLDER = f"{PATH_CLEAN}/{dataset}/images"
-    OUTPUT_MASKS_FOLDER = f"{PATH_CLEAN}/{dataset}/masks"
+    OUTPUT_MASKS_STORE = f"{PATH_CLEAN}/{dataset}/masks.mstore"
     OUTPUT_BBOX_FOLDER = f"{PATH_CLEAN}/{dataset}/bbox"
 
     # Draw bounding boxes on images
     draw_bounding_boxes_on_images(
-        OUTPUT_IMAGES_FOLDER, OUTPUT_MASKS_FOLDER, OUTPUT_BBOX_FOLDER
+        OUTPUT_IMAGES_FOLDER, OUTPUT_MASKS_STORE, OUTPUT_BBOX_FOLDER, indexes[dataset]
     )
 
+# %%
+# Report near-duplicate images inside and across datasets
+report_duplicates(
+    [
+        f"{PATH_CLEAN}/{dataset}/images"
+        for dataset in [
+            "cvc_clinic_db",
+            "cvc_colon_db",
+            "etis_laribpolypdb",
+            "kvasir_seg",
+            "sessile_main_kvasir_seg",
+        ]
+    ]
+)
+
 # %%
 for dataset in [
     "cvc_clinic_db",
@@ -122,8 +168,13 @@ for dataset in [
     OUTPUT_IMAGES_FOLDER = f"{PATH_CLEAN}/{dataset}/images"
     OUTPUT_LABELS_FOLDER = f"{PATH_CLEAN}/{dataset}/labels"
 
-    # Split data into train, validation, and test
-    split_data(OUTPUT_IMAGES_FOLDER, OUTPUT_LABELS_FOLDER)
+    # Split data into train, validation, and test keeping near duplicates together
+    split_data(
+        OUTPUT_IMAGES_FOLDER,
+        OUTPUT_LABELS_FOLDER,
+        duplicates="group",
+        index=indexes[dataset],
+    )
 
 # %%
 for dataset in [
@@ -151,6 +202,73 @@ for dataset in [
     )
 
 
+# %%
+# Statistics of every dataset scanned once and cached
+print_stats_table(
+    PATH_CLEAN,
+    [
+        "cvc_clinic_db",
+        "cvc_colon_db",
+        "etis_laribpolypdb",
+        "kvasir_seg",
+        "sessile_main_kvasir_seg",
+        "polypgen_single",
+        "polypgen_sequence",
+    ],
+)
+
+# %%
+for dataset in ["cvc_colon_db", "etis_laribpolypdb"]:
+    # Precompute augmented variants of the small datasets and compare epoch time and
+    # metrics against online augmentation
+    bank_path = build_augmentation_bank(
+        f"{PATH_CLEAN}/{dataset}/images/train",
+        f"{PATH_CLEAN}/{dataset}/labels/train",
+        f"{PATH_CLEAN}/{dataset}/augmentation_bank/train.abank",
+        variants=8,
+        image_size=640,
+    )
+    benchmark_augmentation_bank(
+        "yolo11n.pt",
+        f"{BASE_PATH_YAML}/{dataset}/dataset.yaml",
+        create_bank_yaml(f"{BASE_PATH_YAML}/{dataset}/dataset.yaml", bank_path),
+        name=dataset,
+        project=f"{BASE_PATH_MODEL}/augmentation_bank",
+        epoches=30,
+    )
+
+# %%
+# Train the models in a resumable queue sharing the CPU cores of the node, choosing
+# the batch size, dataloader workers and image cache of every dataset before training
+QUEUE_STATE = f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/train_queue.json"
+add_training_jobs(
+    QUEUE_STATE,
+    [
+        create_training_job(
+            f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}/yolo11n.pt",
+            f"{BASE_PATH_YAML}/{dataset}/dataset.yaml",
+            name=f"{dataset}",
+            project=f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5",
+            epoches=1000,
+            image_size=640,
+            batch_size=4,
+            save_period=100,
+            threads=4,
+            autotune=True,
+        )
+        for dataset in [
+            "cvc_clinic_db",
+            "cvc_colon_db",
+            "etis_laribpolypdb",
+            "kvasir_seg",
+            "sessile_main_kvasir_seg",
+            "polypgen_single",
+            "polypgen_sequence",
+        ]
+    ],
+)
+run_training_queue(QUEUE_STATE)
+
 # %%
 for dataset in [
     "cvc_clinic_db",
@@ -161,29 +279,30 @@ for dataset in [
     "polypgen_single",
     "polypgen_sequence",
 ]:
-    # Output paths
-    OUTPUT_IMAGES_FOLDER = f"{PATH_CLEAN}/{dataset}/images"
-    OUTPUT_LABELS_FOLDER = f"{PATH_CLEAN}/{dataset}/labels"
-    # Counters
-    total_images = 0
-    total_polyps = 0
-
-    print(f"Dataset: {dataset.upper()}")
-    # Count images in each folder
-    for folder in ["train", "val", "test"]:
-        print(
-            f"Images {folder}: {count_files(f'{OUTPUT_IMAGES_FOLDER}/{folder}', ['.jpg', '.png', '.tif'])}"
-        )
-        print(
-            f"Polyps {folder}: {count_lines_in_file(f'{OUTPUT_LABELS_FOLDER}/{folder}')}"
-        )
-        total_images += count_files(
-            f"{OUTPUT_IMAGES_FOLDER}/{folder}", [".jpg", ".png", ".tif"]
-        )
-        total_polyps += count_lines_in_file(f"{OUTPUT_LABELS_FOLDER}/{folder}")
+    # Export model loading it once, benchmarking and checking every format
+    export_models(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}/{dataset}",
+        ["onnx", "torchscript", "ncnn"],
+        f"{PATH_CLEAN}/{dataset}/images/test",
+    )
 
-    print(f"Total images: {total_images}")
-    print(f"Total polyps: {total_polyps}")
+# %%
+for dataset in [
+    "cvc_clinic_db",
+    "cvc_colon_db",
+    "etis_laribpolypdb",
+    "kvasir_seg",
+    "sessile_main_kvasir_seg",
+    "polypgen_single",
+    "polypgen_sequence",
+]:
+    # Quantize model to INT8 for CPU inference
+    quantize_model(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
+        f"{BASE_PATH_YAML}/{dataset}/dataset.yaml",
+        f"{PATH_CLEAN}/{dataset}",
+        max_accuracy_drop=0.02,
+    )
 
 # %%
 for dataset in [
@@ -195,16 +314,39 @@ for dataset in [
     "polypgen_single",
     "polypgen_sequence",
 ]:
-    # Train model
-    train_model(
-        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}/yolo11n.pt",
+    # Sweep inference image sizes to find the smallest one keeping the sensibility
+    sweep_image_sizes(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
+        f"{PATH_CLEAN}/{dataset}",
+        image_sizes=[320, 384, 448, 512, 640],
+        tolerance=0.02,
+    )
+
+
+# %%
+for dataset in [
+    "cvc_clinic_db",
+    "cvc_colon_db",
+    "etis_laribpolypdb",
+    "kvasir_seg",
+    "sessile_main_kvasir_seg",
+    "polypgen_single",
+    "polypgen_sequence",
+]:
+    # Distill every trained model into a narrower student trained at 512px
+    student_path = distill_model(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
         f"{BASE_PATH_YAML}/{dataset}/dataset.yaml",
-        epoches=1000,
-        image_size=640,
-        batch_size=4,
-        save_period=100,
         name=f"{dataset}",
-        project=f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5",
+        project=f"{BASE_PATH_MODEL}/distill_5",
+        epoches=300,
+        image_size=512,
+    )
+    compare_student_teacher(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
+        student_path,
+        f"{PATH_CLEAN}/{dataset}",
+        image_sizes=[320, 384, 448, 512, 640],
     )
 
 # %%
@@ -217,11 +359,16 @@ for dataset in [
     "polypgen_single",
     "polypgen_sequence",
 ]:
-    # Export model
-    export_model(f"{BASE_PATH_MODEL}/{TRAIN_PATH}/{dataset}", "onnx")
-    export_model(f"{BASE_PATH_MODEL}/{TRAIN_PATH}/{dataset}", "coreml")
-    export_model(f"{BASE_PATH_MODEL}/{TRAIN_PATH}/{dataset}", "ncnn")
-
+    # Prune every trained model until it runs under 40 ms per image on CPU
+    prune_and_finetune(
+        f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
+        f"{BASE_PATH_YAML}/{dataset}/dataset.yaml",
+        name=f"{dataset}",
+        project=f"{BASE_PATH_MODEL}/pruned_5",
+        target_latency_ms=40,
+        epoches=20,
+        export_format="onnx",
+    )
 
 # %%
 for dataset in [
@@ -233,12 +380,16 @@ for dataset in [
     "polypgen_single",
     "polypgen_sequence",
 ]:
-    # Predict model
-    make_predicts(
+    # Predict model overlapping decoding, inference and writing, the boxes are
+    # drawn by render_dataset so cached images are neither decoded nor rewritten
+    predict_pipelined(
         f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}",
         f"{PATH_CLEAN}/{dataset}/images/test",
         name=f"{dataset}",
         project=f"{BASE_PATH_MODEL}/{PREDICT_PATH}_5",
+        save_images=False,
+        label_format="store",
+        cache_path=f"{BASE_PATH_MODEL}/inference_cache.db",
     )
 
 
@@ -255,5 +406,72 @@ for dataset in [
     # Evalute model
     print(f"Evaluating {dataset} dataset")
     gt_image = f"data/clean/{dataset}/labels/test"
-    pred_image = f"runs/predict_5/{dataset}/labels"
+    pred_image = f"runs/predict_5/{dataset}/predictions.pstore"
     evalute_predictions(gt_image, pred_image, iou_threshold=0.75)
+
+
+# %%
+for dataset in [
+    "cvc_clinic_db",
+    "cvc_colon_db",
+    "etis_laribpolypdb",
+    "kvasir_seg",
+    "sessile_main_kvasir_seg",
+]:
+    # Evaluate model against the polyp pixels of the masks
+    print(f"Evaluating {dataset} dataset with masks")
+    evaluate_with_masks(
+        f"{PATH_CLEAN}/{dataset}/labels/test",
+        f"{PATH_CLEAN}/{dataset}/masks.mstore",
+        f"runs/predict_5/{dataset}/predictions.pstore",
+        coverage_threshold=0.5,
+        precision_threshold=0.5,
+    )
+
+
+# %%
+for dataset in [
+    "cvc_clinic_db",
+    "cvc_colon_db",
+    "etis_laribpolypdb",
+    "kvasir_seg",
+    "sessile_main_kvasir_seg",
+    "polypgen_single",
+    "polypgen_sequence",
+]:
+    # Ground truth (green) and predictions (red) with contact sheets for review
+    render_dataset(
+        f"{PATH_CLEAN}/{dataset}/images/test",
+        f"{BASE_PATH_MODEL}/{PREDICT_PATH}_5/{dataset}/review",
+        gt_labels_path=f"{PATH_CLEAN}/{dataset}/labels/test",
+        predictions_path=f"runs/predict_5/{dataset}/predictions.pstore",
+        thumbnail_size=256,
+    )
+
+
+# %%
+# Generalization matrix of every model on the test split of every dataset
+DATASETS = [
+    "cvc_clinic_db",
+    "cvc_colon_db",
+    "etis_laribpolypdb",
+    "kvasir_seg",
+    "sessile_main_kvasir_seg",
+    "polypgen_single",
+    "polypgen_sequence",
+]
+cross_evaluate(
+    {dataset: f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}" for dataset in DATASETS},
+    {dataset: f"{PATH_CLEAN}/{dataset}" for dataset in DATASETS},
+    f"{BASE_PATH_MODEL}/cross_evaluation_5",
+    iou_threshold=0.75,
+)
+
+# %%
+# Real-time replay of a PolypGen test sequence at the colonoscopy frame rate
+replay_report(
+    {dataset: f"{BASE_PATH_MODEL}/{TRAIN_PATH}_5/{dataset}" for dataset in DATASETS},
+    f"{PATH_RAW}/polypgen/sequenceData/positive/seq16/images_seq16",
+    f"{BASE_PATH_MODEL}/realtime_replay_5",
+    fps=25,
+)
@@ -1,7 +1,6 @@
 import os
 import shutil
 import numpy as np
-import cv2 as cv
 import os.path
 import yaml
 from scripts.process_images import (
@@ -10,13 +9,20 @@ from scripts.process_images import (
     yolo_format,
 )
 from scripts.manage_data import (
+    copy_file,
     create_dir,
 )
+from scripts.archive_data import is_archive_path, list_archive_dir, read_image
 # from google.colab.patches import cv2_imshow
 
 
 def detect_imgs(infolder, ext=".tif"):
-    items = os.listdir(infolder)
+    # The folder can be inside the downloaded zip archive
+    items = (
+        list_archive_dir(infolder)
+        if is_archive_path(infolder)
+        else os.listdir(infolder)
+    )
 
     flist = []
     for names in items:
@@ -36,9 +42,12 @@ def save_bbox(txt_path, line):
 # Global variables
 _EXT_FILE = ".jpg"  # image extension
 _BASE_FOLDER = "data/clean"
+# It can also be a folder inside the downloaded zip archive,
+# e.g. "data/raw/polypgen.zip/PolypGen2021_MultiCenterData_v3"
 _PATH_DATA = "data/raw/polypgen"
 _NAME_DB = "polypgen"
 _PATH_DATA_SEQ = _PATH_DATA + "/sequenceData/positive"
+_BLOB_STORE = "data/blobs"  # content-addressed store shared with main.py
 
 dbPolyps = _BASE_FOLDER + "/" + _NAME_DB
 dirImages = dbPolyps + "/" + "images"
@@ -98,7 +107,7 @@ def FindImages(
         for ii, imageFile in enumerate(allfileList[:]):
             "listimage files and find the type and modality of polyp"
             fileNameOnly = imageFile.split(os.sep)[-1].split(".")[0]
-            image = cv.imread(imageFile)
+            image = read_image(imageFile)
             maskFile = maskDir + "/" + fileNameOnly + "_mask" + ext_file
             maskFile = maskFile.replace("]", "")
             "distinguish sizes of polyps and quantify numbers for each case"
@@ -108,8 +117,8 @@ def FindImages(
             if maskCordinates is not None:
                 h, w, c = image.shape
                 line = yolo_format(0, maskCordinates, w, h)
-                shutil.copy(imageFile, dir_Images)
-                shutil.copy(maskFile, dir_Masks)
+                copy_file(imageFile, dir_Images, _BLOB_STORE)
+                copy_file(maskFile, dir_Masks, _BLOB_STORE)
                 save_bbox(dir_labels + "/" + fileNameOnly, "\n".join(line))
                 "Move image and create file"
 
@@ -0,0 +1,136 @@
+import os
+import threading
+import zipfile
+import cv2
+import numpy as np
+
+ARCHIVE_EXT = ".zip"
+
+# Open archives and their member index, built once per archive and modification time
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def split_archive_path(path: str) -> tuple[str, str] | None:
+    """
+    Split a path inside an archive, like data/raw/kvasir-seg.zip/Kvasir-SEG/images, into the archive and the member path.
+
+    Args:
+        path (str): Path to split.
+
+    Returns:
+        tuple[str, str] | None: Path of the archive and path of the member inside it, None if the path is not inside an archive.
+    """
+    parts = path.replace("\\", "/").split("/")
+    for i, part in enumerate(parts):
+        if part.lower().endswith(ARCHIVE_EXT):
+            archive_path = "/".join(parts[: i + 1])
+            if os.path.isfile(archive_path):
+                return archive_path, "/".join(filter(None, parts[i + 1 :]))
+    return None
+
+
+def is_archive_path(path: str) -> bool:
+    """
+    Check if a path is an archive or a path inside an archive.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is inside an archive.
+    """
+    return split_archive_path(path) is not None
+
+
+def open_archive(archive_path: str) -> tuple[zipfile.ZipFile, dict, threading.Lock]:
+    """
+    Return the open archive, the index of its files (member name to ZipInfo) and the lock to read it, opening the archive and building the index only the first time.
+
+    Args:
+        archive_path (str): Path of the archive.
+
+    Returns:
+        tuple[zipfile.ZipFile, dict, threading.Lock]: Archive, member index and lock.
+    """
+    key = (os.path.abspath(archive_path), os.stat(archive_path).st_mtime_ns)
+    with _archives_lock:
+        if key not in _archives:
+            archive = zipfile.ZipFile(archive_path)
+            index = {
+                info.filename: info for info in archive.infolist() if not info.is_dir()
+            }
+            _archives[key] = (archive, index, threading.Lock())
+        return _archives[key]
+
+
+def list_archive_dir(path: str) -> list[str]:
+    """
+    Return the names of the files directly inside a directory of an archive, like os.listdir.
+
+    Args:
+        path (str): Path of the directory inside the archive.
+
+    Raises:
+        FileNotFoundError: If the path is not inside an archive.
+
+    Returns:
+        list[str]: Names of the files.
+    """
+    split = split_archive_path(path)
+    if split is None:
+        raise FileNotFoundError(f"Archive of {path} not found.")
+    archive_path, member_dir = split
+    _, index, _ = open_archive(archive_path)
+    prefix = f"{member_dir}/" if member_dir else ""
+    return [
+        name[len(prefix) :]
+        for name in index
+        if name.startswith(prefix) and "/" not in name[len(prefix) :]
+    ]
+
+
+def read_file_bytes(path: str) -> bytes:
+    """
+    Read the content of a file from disk or from inside an archive, without extracting it.
+
+    Args:
+        path (str): Path of the file, on disk or inside an archive.
+
+    Raises:
+        FileNotFoundError: If the file is not found.
+
+    Returns:
+        bytes: Content of the file.
+    """
+    split = split_archive_path(path)
+    if split is None:
+        with open(path, "rb") as file:
+            return file.read()
+
+    archive_path, member = split
+    archive, index, lock = open_archive(archive_path)
+    if member not in index:
+        raise FileNotFoundError(f"File {member} not found in {archive_path}.")
+    with lock:
+        return archive.read(index[member])
+
+
+def read_image(path: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray | None:
+    """
+    Decode an image from disk or from its buffer inside an archive.
+
+    Args:
+        path (str): Path of the image, on disk or inside an archive.
+        flags (int, optional): Flags of cv2.imread. Defaults to cv2.IMREAD_COLOR.
+
+    Returns:
+        np.ndarray | None: Decoded image or None if it can not be read.
+    """
+    if not is_archive_path(path):
+        return cv2.imread(path, flags)
+    try:
+        data = read_file_bytes(path)
+    except FileNotFoundError:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
@@ -0,0 +1,394 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+from .archive_data import read_image
+from .manage_data import create_dir, detect_files
+from .prediction_store import read_label_file
+
+# Gain of the random hue, saturation and value jitter, as in the ultralytics defaults
+HSV_GAIN = (0.015, 0.7, 0.4)
+
+
+def augment_image(
+    image: np.ndarray,
+    rows: np.ndarray,
+    image_size: int,
+    rng: np.random.Generator | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fit an image in a square canvas of image_size, randomly flipped, scaled, translated and color jittered when a generator is given. Only axis-aligned transforms are used so the boxes are transformed exactly, and boxes left mostly outside the canvas are dropped.
+
+    Args:
+        image (np.ndarray): BGR image.
+        rows (np.ndarray): Rows (class, x_center, y_center, width, height) with normalized coordinates.
+        image_size (int): Side of the output image.
+        rng (np.random.Generator | None, optional): Generator of the random transforms. Defaults to None (no augmentation).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Augmented image and its rows.
+    """
+    height, width = image.shape[:2]
+    classes = rows[:, :1]
+    x_center, y_center, box_width, box_height = rows[:, 1:5].T
+    boxes = np.stack(
+        [
+            (x_center - box_width / 2) * width,
+            (y_center - box_height / 2) * height,
+            (x_center + box_width / 2) * width,
+            (y_center + box_height / 2) * height,
+        ],
+        axis=1,
+    )
+
+    scale = image_size / max(height, width)
+    shift = np.zeros(2)
+    if rng is not None:
+        if rng.random() < 0.5:
+            image = image[:, ::-1]
+            boxes[:, [0, 2]] = width - boxes[:, [2, 0]]
+        if rng.random() < 0.5:
+            image = image[::-1]
+            boxes[:, [1, 3]] = height - boxes[:, [3, 1]]
+        scale *= rng.uniform(0.75, 1.25)
+        shift = rng.uniform(-0.1, 0.1, 2) * image_size
+
+    offset_x = (image_size - width * scale) / 2 + shift[0]
+    offset_y = (image_size - height * scale) / 2 + shift[1]
+    matrix = np.array([[scale, 0, offset_x], [0, scale, offset_y]])
+    image = cv2.warpAffine(
+        np.ascontiguousarray(image),
+        matrix,
+        (image_size, image_size),
+        flags=cv2.INTER_LINEAR,
+        borderValue=(114, 114, 114),
+    )
+
+    if rng is not None:
+        gains = rng.uniform(-1, 1, 3) * HSV_GAIN + 1
+        hue, saturation, value = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+        x = np.arange(256)
+        image = cv2.cvtColor(
+            cv2.merge(
+                (
+                    cv2.LUT(hue, ((x * gains[0]) % 180).astype(np.uint8)),
+                    cv2.LUT(saturation, np.clip(x * gains[1], 0, 255).astype(np.uint8)),
+                    cv2.LUT(value, np.clip(x * gains[2], 0, 255).astype(np.uint8)),
+                )
+            ),
+            cv2.COLOR_HSV2BGR,
+        )
+
+    boxes = boxes * scale + [offset_x, offset_y, offset_x, offset_y]
+    clipped = np.clip(boxes, 0, image_size)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    clipped_width = clipped[:, 2] - clipped[:, 0]
+    clipped_height = clipped[:, 3] - clipped[:, 1]
+    keep = (
+        (clipped_width >= 2)
+        & (clipped_height >= 2)
+        & (clipped_width * clipped_height >= 0.2 * area)
+    )
+    clipped = clipped[keep] / image_size
+    rows = np.concatenate(
+        [
+            classes[keep],
+            (clipped[:, :2] + clipped[:, 2:]) / 2,
+            clipped[:, 2:] - clipped[:, :2],
+        ],
+        axis=1,
+    )
+    return image, rows.astype(np.float32)
+
+
+def build_augmentation_bank(
+    images_path: str,
+    labels_path: str,
+    bank_path: str,
+    variants: int = 8,
+    image_size: int = 640,
+    seed: int = 42,
+    quality: int = 95,
+    workers: int | None = None,
+) -> str:
+    """
+    Precompute variants of every training image with a pool of workers and pack them in a single file (bank.abank) of JPEG buffers, with an index of the name, byte offset, size and labels of every variant (bank.abank.index). The first variant of every image is not augmented and the random transforms of every variant are seeded by the image and variant, so the bank does not depend on the number of workers.
+
+    Args:
+        images_path (str): Path of the training images.
+        labels_path (str): Path of the training labels.
+        bank_path (str): Path of the bank, ending with .abank.
+        variants (int, optional): Variants per image, including the original. Defaults to 8.
+        image_size (int, optional): Side of the square variants, the training image size. Defaults to 640.
+        seed (int, optional): Random number seed. Defaults to 42.
+        quality (int, optional): JPEG quality of the variants. Defaults to 95.
+        workers (int | None, optional): Number of workers. Defaults to the number of cores.
+
+    Returns:
+        str: Path of the bank.
+    """
+    create_dir(os.path.dirname(bank_path) or ".")
+    images = detect_files(images_path, [".png", ".jpg", ".tif"])
+
+    def augment(item: tuple[int, str]) -> list[tuple[str, bytes, np.ndarray]]:
+        index, image_path = item
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        label_file = os.path.join(labels_path, f"{base_name}.txt")
+        rows = (
+            read_label_file(label_file)
+            if os.path.exists(label_file)
+            else np.zeros((0, 5), np.float32)
+        )
+        image = read_image(image_path)
+        outputs = []
+        for variant in range(variants):
+            rng = np.random.default_rng([seed, index, variant]) if variant else None
+            augmented, augmented_rows = augment_image(image, rows, image_size, rng)
+            _, buffer = cv2.imencode(
+                ".jpg", augmented, [cv2.IMWRITE_JPEG_QUALITY, quality]
+            )
+            outputs.append(
+                (f"{base_name}_aug{variant}", buffer.tobytes(), augmented_rows)
+            )
+        return outputs
+
+    index = []
+    offset = 0
+    with open(bank_path, "wb") as file:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for outputs in executor.map(augment, enumerate(images)):
+                for name, data, rows in outputs:
+                    file.write(data)
+                    index.append(
+                        {
+                            "name": name,
+                            "offset": offset,
+                            "size": len(data),
+                            "image_size": image_size,
+                            "labels": rows.tolist(),
+                        }
+                    )
+                    offset += len(data)
+
+    with open(bank_path + ".index", "w") as file:
+        json.dump(index, file)
+    print(
+        f"Variants packed: {len(index)} of {len(images)} images, {offset / 2**20:.1f} MiB"
+    )
+    return bank_path
+
+
+def create_bank_yaml(yaml_path: str, bank_path: str) -> str:
+    """
+    Create a copy of a dataset YAML file that registers an augmentation bank as its training split (dataset_bank.yaml next to it), read by BankTrainer.
+
+    Args:
+        yaml_path (str): Path from the yaml file with the dataset information.
+        bank_path (str): Path of the bank.
+
+    Returns:
+        str: Path of the new YAML file.
+    """
+    with open(yaml_path, "r") as file:
+        data = yaml.safe_load(file)
+    data["train_bank"] = os.path.abspath(bank_path)
+
+    bank_yaml_path = os.path.join(os.path.dirname(yaml_path), "dataset_bank.yaml")
+    with open(bank_yaml_path, "w") as file:
+        yaml.dump(data, file)
+    return bank_yaml_path
+
+
+class AugmentationBankDataset(YOLODataset):
+    """
+    Training dataset that reads the precomputed variants of an augmentation bank from a memory-mapped file instead of augmenting the images online. An epoch has one sample per source image, a variant drawn at random, so it sees as many samples as an epoch with online augmentation.
+    """
+
+    def __init__(self, bank_path: str, *args, **kwargs):
+        """
+        Args:
+            bank_path (str): Path of the bank.
+            *args, **kwargs: Arguments of YOLODataset.
+        """
+        with open(bank_path + ".index", "r") as file:
+            self.bank_index = json.load(file)
+        self.bank = np.memmap(bank_path, dtype=np.uint8, mode="r")
+        super().__init__(bank_path, *args, **kwargs)
+
+        # Variants of every source image, consecutive in the bank (name_aug0, name_aug1, ...)
+        self.sources = {}
+        for i, im_file in enumerate(self.im_files):
+            source = os.path.basename(im_file).rsplit("_aug", 1)[0]
+            self.sources.setdefault(source, []).append(i)
+        self.sources = list(self.sources.values())
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def get_image_and_label(self, index: int) -> dict:
+        variants = self.sources[index]
+        return super().get_image_and_label(variants[np.random.randint(len(variants))])
+
+    def get_img_files(self, img_path: str) -> list[str]:
+        files = [f"{img_path}/{entry['name']}.jpg" for entry in self.bank_index]
+        return files[: round(len(files) * getattr(self, "fraction", 1.0))]
+
+    def get_labels(self) -> list[dict]:
+        labels = []
+        for im_file, entry in zip(self.im_files, self.bank_index):
+            rows = np.array(entry["labels"], dtype=np.float32).reshape(-1, 5)
+            labels.append(
+                {
+                    "im_file": im_file,
+                    "shape": (entry["image_size"], entry["image_size"]),
+                    "cls": rows[:, :1],
+                    "bboxes": rows[:, 1:],
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                }
+            )
+        return labels
+
+    def load_image(self, i: int, rect_mode: bool = True) -> tuple:
+        entry = self.bank_index[i]
+        data = self.bank[entry["offset"] : entry["offset"] + entry["size"]]
+        image = cv2.imdecode(np.asarray(data), cv2.IMREAD_COLOR)
+        original_shape = image.shape[:2]
+        if max(original_shape) != self.imgsz:
+            ratio = self.imgsz / max(original_shape)
+            image = cv2.resize(
+                image,
+                (round(original_shape[1] * ratio), round(original_shape[0] * ratio)),
+                interpolation=cv2.INTER_LINEAR,
+            )
+        return image, original_shape, image.shape[:2]
+
+
+class BankTrainer(DetectionTrainer):
+    """
+    Detection trainer that trains on the augmentation bank registered in the dataset YAML (train_bank), without online augmentation, and validates on the usual split.
+    """
+
+    def build_dataset(
+        self, img_path: str, mode: str = "train", batch: int | None = None
+    ):
+        bank_path = self.data.get("train_bank")
+        if mode != "train" or not bank_path:
+            return super().build_dataset(img_path, mode, batch)
+        stride = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return AugmentationBankDataset(
+            bank_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=False,
+            hyp=self.args,
+            rect=False,
+            cache=False,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0,
+            prefix=colorstr(f"{mode}: "),
+            classes=self.args.classes,
+            fraction=self.args.fraction,
+            data=self.data,
+            task=self.args.task,
+        )
+
+
+def benchmark_augmentation_bank(
+    model_path: str,
+    yaml_path: str,
+    bank_yaml_path: str,
+    name: str,
+    project: str,
+    epoches: int = 30,
+    image_size: int = 640,
+    batch_size: int = 8,
+    device: str = "cpu",
+) -> dict:
+    """
+    Train the same model with online augmentation and with the augmentation bank and compare the mean epoch time (without validation), the time per training sample and the final validation metrics. Both epochs have one sample per source image, so both trainings do the same optimizer steps. The result is saved in name_augmentation_benchmark.json in the project.
+
+    Args:
+        model_path (str): Path of the model to train.
+        yaml_path (str): Path from the yaml file of the dataset.
+        bank_yaml_path (str): Path from the yaml file returned by create_bank_yaml.
+        name (str): Name of the dataset, the runs are saved as name_online and name_bank.
+        project (str): Project to save the runs.
+        epoches (int, optional): Number of epoches of every training. Defaults to 30.
+        image_size (int, optional): Training image size. Defaults to 640.
+        batch_size (int, optional): Size of the batch. Defaults to 8.
+        device (str, optional): Device to train on. Defaults to "cpu".
+
+    Returns:
+        dict: Mean epoch time, time per sample, samples per epoch and final metrics of both trainings.
+    """
+    report = {}
+    for mode, data, trainer in [
+        ("online", yaml_path, None),
+        ("bank", bank_yaml_path, BankTrainer),
+    ]:
+        epoch_times = []
+        final_metrics = {}
+        samples = []
+
+        def on_train_epoch_start(trainer) -> None:
+            samples.append(len(trainer.train_loader.dataset))
+            epoch_times.append(-time.perf_counter())
+
+        def on_train_epoch_end(trainer) -> None:
+            epoch_times[-1] += time.perf_counter()
+
+        def on_train_end(trainer) -> None:
+            final_metrics.update(
+                {key: float(value) for key, value in trainer.metrics.items()}
+            )
+
+        model = YOLO(model_path)
+        model.add_callback("on_train_epoch_start", on_train_epoch_start)
+        model.add_callback("on_train_epoch_end", on_train_epoch_end)
+        model.add_callback("on_train_end", on_train_end)
+        model.train(
+            data=data,
+            trainer=trainer,
+            epochs=epoches,
+            imgsz=image_size,
+            batch=batch_size,
+            device=device,
+            name=f"{name}_{mode}",
+            project=project,
+            exist_ok=True,
+        )
+        report[mode] = {
+            "mean_epoch_s": float(np.mean(epoch_times)),
+            "samples_per_epoch": samples[-1],
+            "mean_sample_ms": float(np.sum(epoch_times) / np.sum(samples) * 1000),
+            "metrics": final_metrics,
+        }
+        print(
+            f"{name} {mode}: {report[mode]['mean_epoch_s']:.1f} s/epoch, "
+            f"{report[mode]['mean_sample_ms']:.1f} ms/sample, "
+            f"mAP50 {final_metrics.get('metrics/mAP50(B)', 0):.3f}"
+        )
+
+    report["epoch_speedup"] = (
+        report["online"]["mean_epoch_s"] / report["bank"]["mean_epoch_s"]
+    )
+    report["sample_speedup"] = (
+        report["online"]["mean_sample_ms"] / report["bank"]["mean_sample_ms"]
+    )
+    with open(
+        os.path.join(project, f"{name}_augmentation_benchmark.json"), "w"
+    ) as file:
+        json.dump(report, file, indent=2)
+    return report
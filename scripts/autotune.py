@@ -0,0 +1,278 @@
+import itertools
+import json
+import os
+import tempfile
+import time
+import psutil
+import yaml
+from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+from .manage_data import count_files, create_dir
+
+
+def get_process_memory() -> int:
+    """
+    Return the resident memory of the current process and its children (the dataloader workers).
+
+    Returns:
+        int: Resident memory in bytes.
+    """
+    process = psutil.Process()
+    memory = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            memory += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return memory
+
+
+def count_train_images(yaml_path: str) -> int:
+    """
+    Count the training images of the dataset of a YAML file.
+
+    Args:
+        yaml_path (str): Path from the yaml file with the dataset information.
+
+    Returns:
+        int: Number of training images.
+    """
+    with open(yaml_path, "r") as file:
+        data = yaml.safe_load(file)
+    return count_files(
+        os.path.join(data.get("path", ""), data["train"]), [".png", ".jpg", ".tif"]
+    )
+
+
+class ProbeTrainer(DetectionTrainer):
+    """
+    Trainer of the short trainings of the auto-tuner, without the validation that ultralytics runs after the last epoch even with val=False.
+    """
+
+    def validate(self):
+        return {}, 0.0
+
+    def final_eval(self):
+        pass
+
+
+def measure_loader(
+    model_path: str,
+    yaml_path: str,
+    image_size: int,
+    batch_size: int,
+    workers: int,
+    cache: bool | str,
+    train_images: int,
+    max_batches: int = 20,
+    warmup_batches: int = 3,
+    device: str = "cpu",
+) -> dict:
+    """
+    Run a short training of one epoch over a fraction of the dataset, without validation, and measure the training samples per second after the warmup batches and the peak memory of the process and its workers. With the RAM cache only the fraction of the images is cached, so the memory used by the training is scaled to the full dataset.
+
+    Args:
+        model_path (str): Path of the model to train.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        image_size (int): Resize the images to this size.
+        batch_size (int): Size of the batch.
+        workers (int): Number of dataloader workers.
+        cache (bool | str): Image cache mode of ultralytics (False, "ram" or "disk").
+        train_images (int): Number of training images of the dataset.
+        max_batches (int, optional): Batches of the short training. Defaults to 20.
+        warmup_batches (int, optional): First batches not measured. Defaults to 3.
+        device (str, optional): Device to train on. Defaults to "cpu".
+
+    Returns:
+        dict: Configuration, samples per second, peak memory and estimated memory of the full run in MiB.
+    """
+    batch_ends = []
+    start_memory = get_process_memory()
+    peak_memory = [start_memory]
+    fraction = min(1.0, max_batches * batch_size / max(train_images, 1))
+
+    def on_train_batch_end(trainer) -> None:
+        batch_ends.append(time.perf_counter())
+        peak_memory[0] = max(peak_memory[0], get_process_memory())
+
+    model = YOLO(model_path)
+    model.add_callback("on_train_batch_end", on_train_batch_end)
+    with tempfile.TemporaryDirectory() as project:
+        model.train(
+            data=yaml_path,
+            trainer=ProbeTrainer,
+            epochs=1,
+            imgsz=image_size,
+            batch=batch_size,
+            workers=workers,
+            cache=cache,
+            fraction=fraction,
+            device=device,
+            val=False,
+            plots=False,
+            save=False,
+            project=project,
+            name="autotune",
+            verbose=False,
+        )
+
+    measured = batch_ends[warmup_batches:]
+    samples_per_second = (
+        (len(measured) - 1) * batch_size / (measured[-1] - measured[0])
+        if len(measured) > 1
+        else 0.0
+    )
+    estimated_memory = peak_memory[0]
+    if cache in (True, "ram"):
+        estimated_memory = start_memory + (peak_memory[0] - start_memory) / fraction
+    return {
+        "batch_size": batch_size,
+        "workers": workers,
+        "cache": cache,
+        "samples_per_second": samples_per_second,
+        "peak_memory_mb": peak_memory[0] / 2**20,
+        "estimated_memory_mb": estimated_memory / 2**20,
+    }
+
+
+def autotune_loader(
+    model_path: str,
+    yaml_path: str,
+    name: str,
+    project: str,
+    image_size: int = 640,
+    batch_sizes: list[int] | None = None,
+    workers: list[int] | None = None,
+    caches: list | None = None,
+    max_batches: int = 20,
+    max_memory_fraction: float = 0.8,
+    device: str = "cpu",
+    use_cache: bool = True,
+) -> dict:
+    """
+    Choose the batch size, dataloader workers and image cache mode with short trainings on the dataset, tuning one at a time instead of every combination: the batch size with the most workers and no cache, then the workers with that batch size, then the cache mode. Each stage keeps the configuration with most samples per second whose estimated memory on the full dataset is below max_memory_fraction of the memory of the node. The results and the choice are saved in autotune.json in the run directory, and reused while the search space does not change.
+
+    Args:
+        model_path (str): Path of the model to train.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        name (str): Name of the model.
+        project (str): Project to save the model.
+        image_size (int, optional): Resize the images to this size. Defaults to 640.
+        batch_sizes (list[int] | None, optional): Batch sizes to try. Defaults to [4, 8, 16].
+        workers (list[int] | None, optional): Dataloader workers to try. Defaults to [0, 2, 4, 8] up to the available cores.
+        caches (list | None, optional): Image cache modes to try. Defaults to [False, "ram", "disk"].
+        max_batches (int, optional): Batches of every short training. Defaults to 20.
+        max_memory_fraction (float, optional): Maximum share of the memory of the node. Defaults to 0.8.
+        device (str, optional): Device to train on. Defaults to "cpu".
+        use_cache (bool, optional): Reuse a previous autotune.json with the same search space. Defaults to True.
+
+    Raises:
+        RuntimeError: If no configuration of a stage fits in memory.
+
+    Returns:
+        dict: Chosen batch_size, workers and cache.
+    """
+    sched_getaffinity = getattr(os, "sched_getaffinity", None)
+    cores = len(sched_getaffinity(0)) if sched_getaffinity else os.cpu_count() or 1
+    search = {
+        "yaml_path": yaml_path,
+        "image_size": image_size,
+        "batch_sizes": batch_sizes or [4, 8, 16],
+        "workers": workers or [value for value in [0, 2, 4, 8] if value <= cores],
+        "caches": caches or [False, "ram", "disk"],
+    }
+
+    run_path = os.path.join(project, name)
+    report_path = os.path.join(run_path, "autotune.json")
+    if use_cache and os.path.exists(report_path):
+        with open(report_path, "r") as file:
+            report = json.load(file)
+        if report["search"] == search:
+            return report["best"]
+
+    train_images = count_train_images(yaml_path)
+    max_memory_mb = psutil.virtual_memory().total * max_memory_fraction / 2**20
+    results = {}
+
+    def probe(batch_size: int, worker_count: int, cache: bool | str) -> dict:
+        key = (batch_size, worker_count, cache)
+        if key in results:
+            return results[key]
+        try:
+            result = measure_loader(
+                model_path,
+                yaml_path,
+                image_size,
+                batch_size,
+                worker_count,
+                cache,
+                train_images,
+                max_batches=max_batches,
+                device=device,
+            )
+        except (RuntimeError, MemoryError) as error:
+            result = {
+                "batch_size": batch_size,
+                "workers": worker_count,
+                "cache": cache,
+                "error": str(error),
+            }
+        results[key] = result
+        print(
+            f"batch {batch_size}, workers {worker_count}, cache {cache}: "
+            + (
+                f"{result['samples_per_second']:.1f} samples/s, "
+                f"{result['estimated_memory_mb']:.0f} MiB"
+                if "error" not in result
+                else f"failed ({result['error']})"
+            )
+        )
+        return result
+
+    def select(stage: list[dict]) -> dict:
+        candidates = [
+            result
+            for result in stage
+            if "error" not in result and result["estimated_memory_mb"] <= max_memory_mb
+        ]
+        if not candidates:
+            raise RuntimeError(
+                f"No loader configuration fits in {max_memory_mb:.0f} MiB."
+            )
+        return max(candidates, key=lambda result: result["samples_per_second"])
+
+    best = select(
+        [
+            probe(batch_size, max(search["workers"]), search["caches"][0])
+            for batch_size in search["batch_sizes"]
+        ]
+    )
+    best = select(
+        [
+            probe(best["batch_size"], worker_count, best["cache"])
+            for worker_count in search["workers"]
+        ]
+    )
+    best = select(
+        [
+            probe(best["batch_size"], best["workers"], cache)
+            for cache in search["caches"]
+        ]
+    )
+    best = {key: best[key] for key in ["batch_size", "workers", "cache"]}
+
+    create_dir(run_path)
+    with open(report_path, "w") as file:
+        json.dump(
+            {
+                "search": search,
+                "cores": cores,
+                "max_memory_mb": max_memory_mb,
+                "results": list(results.values()),
+                "best": best,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Best loader configuration: {best}")
+    return best
@@ -0,0 +1,142 @@
+import os
+import random
+import shutil
+import time
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from .evalute_datasets import evalute_predictions
+from .manage_data import detect_files
+
+
+def sample_images(images_path: str, sample_size: int, seed: int = 42) -> list[str]:
+    """
+    Return a reproducible random sample of the images in a directory.
+
+    Args:
+        images_path (str): Path to the images.
+        sample_size (int): Number of images to sample, all of them if there are fewer.
+        seed (int, optional): Random number seed. Defaults to 42.
+
+    Returns:
+        list[str]: Sorted list of sampled image paths.
+    """
+    images = detect_files(images_path, [".png", ".jpg", ".tif"])
+    if len(images) <= sample_size:
+        return images
+    return sorted(random.Random(seed).sample(images, sample_size))
+
+
+def load_images(image_paths: list[str]) -> list[np.ndarray]:
+    """
+    Decode a list of images, so the benchmarks measure only the inference.
+
+    Args:
+        image_paths (list[str]): Paths of the images.
+
+    Returns:
+        list[np.ndarray]: Decoded BGR images.
+    """
+    return [cv2.imread(image_path) for image_path in image_paths]
+
+
+def measure_latency(
+    model: YOLO,
+    images: list[np.ndarray],
+    batch_size: int,
+    image_size: int = 640,
+    device: str = "cpu",
+    warmup: int = 2,
+    repeats: int = 3,
+) -> dict:
+    """
+    Measure the inference latency and throughput of a model over decoded images at a batch size.
+
+    Args:
+        model (YOLO): Model to benchmark, either a PyTorch checkpoint or an exported artifact.
+        images (list[np.ndarray]): Decoded images to feed the model.
+        batch_size (int): Number of images per inference call.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        device (str, optional): Device to run on. Defaults to "cpu".
+        warmup (int, optional): Number of untimed batches before measuring. Defaults to 2.
+        repeats (int, optional): Number of timed passes over the images. Defaults to 3.
+
+    Returns:
+        dict: Batch latency, latency per image (ms) and throughput (images per second).
+    """
+    # Repeat the images if there are not enough to fill a batch
+    if len(images) < batch_size:
+        images = (images * batch_size)[:batch_size]
+    batches = [
+        images[i : i + batch_size]
+        for i in range(0, len(images) - batch_size + 1, batch_size)
+    ]
+
+    for i in range(warmup):
+        model.predict(
+            batches[i % len(batches)], imgsz=image_size, device=device, verbose=False
+        )
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            model.predict(batch, imgsz=image_size, device=device, verbose=False)
+    elapsed = time.perf_counter() - start
+
+    total_batches = repeats * len(batches)
+    total_images = total_batches * batch_size
+    return {
+        "batch_size": batch_size,
+        "latency_ms": elapsed / total_batches * 1000,
+        "latency_per_image_ms": elapsed / total_images * 1000,
+        "throughput": total_images / elapsed,
+    }
+
+
+def predict_and_evaluate(
+    model: YOLO,
+    images_path: str,
+    labels_path: str,
+    name: str,
+    project: str,
+    image_size: int = 640,
+    iou_threshold: float = 0.75,
+    device: str = "cpu",
+) -> dict:
+    """
+    Predict the labels of a folder of images and score them with evalute_predictions against the ground truth labels.
+
+    Args:
+        model (YOLO): Model to evaluate, either a PyTorch checkpoint or an exported artifact.
+        images_path (str): Path to the images.
+        labels_path (str): Path to the ground truth labels of the images.
+        name (str): Name of the prediction run.
+        project (str): Project to save the predicted labels.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        iou_threshold (float, optional): IoU threshold of the evaluation. Defaults to 0.75.
+        device (str, optional): Device to run on. Defaults to "cpu".
+
+    Returns:
+        dict: Metrics returned by evalute_predictions.
+    """
+    # Remove labels of a previous run, images without detections do not overwrite them
+    pred_labels_path = os.path.join(project, name, "labels")
+    if os.path.isdir(pred_labels_path):
+        shutil.rmtree(pred_labels_path)
+
+    for _ in model.predict(
+        images_path,
+        imgsz=image_size,
+        save_txt=True,
+        name=name,
+        project=project,
+        exist_ok=True,
+        device=device,
+        stream=True,
+        verbose=False,
+    ):
+        pass
+
+    return evalute_predictions(
+        labels_path, pred_labels_path, iou_threshold=iou_threshold, verbose=False
+    )
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import shutil
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Return the SHA-256 digest of the content of a file.
+
+    Args:
+        file_path (str): Path of the file.
+        chunk_size (int, optional): Bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_blob_path(store_path: str, digest: str) -> str:
+    """
+    Return the path of a blob in the store, sharded by the first two bytes of its digest.
+
+    Args:
+        store_path (str): Path of the blob store.
+        digest (str): Hexadecimal digest of the blob.
+
+    Returns:
+        str: Path of the blob (store/ab/cd/abcd...).
+    """
+    return os.path.join(store_path, digest[:2], digest[2:4], digest)
+
+
+def add_blob(store_path: str, file_path: str) -> str:
+    """
+    Add a file to the blob store if its content is not already there.
+
+    Args:
+        store_path (str): Path of the blob store.
+        file_path (str): Path of the file to add.
+
+    Returns:
+        str: Path of the blob with the content of the file.
+    """
+    blob_path = get_blob_path(store_path, hash_file(file_path))
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Copy to a temporary name first so an interrupted copy never leaves a bad blob
+        tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+    return blob_path
+
+
+def add_blob_bytes(store_path: str, data: bytes) -> str:
+    """
+    Add a content read in memory (for example a member of an archive) to the blob store if it is not already there.
+
+    Args:
+        store_path (str): Path of the blob store.
+        data (bytes): Content to add.
+
+    Returns:
+        str: Path of the blob with the content.
+    """
+    blob_path = get_blob_path(store_path, hashlib.sha256(data).hexdigest())
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, blob_path)
+    return blob_path
+
+
+def link_blob(blob_path: str, output_file_path: str) -> None:
+    """
+    Materialize a blob at a path of a dataset view with a hard link, falling back to a symbolic link and to a copy when links are not supported.
+
+    Args:
+        blob_path (str): Path of the blob.
+        output_file_path (str): Path of the file in the dataset view.
+    """
+    if os.path.lexists(output_file_path):
+        os.remove(output_file_path)
+    try:
+        os.link(blob_path, output_file_path)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(blob_path), output_file_path)
+        except OSError:
+            shutil.copyfile(blob_path, output_file_path)
+
+
+def store_file(store_path: str, file_path: str, output_file_path: str) -> None:
+    """
+    Copy a file to a dataset view through the blob store, so identical files are stored once. Files in a view must be replaced, never written in place, because they share their content with the blob.
+
+    Args:
+        store_path (str): Path of the blob store.
+        file_path (str): Path of the file to copy.
+        output_file_path (str): Path of the file in the dataset view.
+    """
+    link_blob(add_blob(store_path, file_path), output_file_path)
+
+
+def list_blobs(store_path: str) -> list[str]:
+    """
+    Return the paths of all the blobs in the store.
+
+    Args:
+        store_path (str): Path of the blob store.
+
+    Returns:
+        list[str]: Paths of the blobs.
+    """
+    blobs = []
+    for root, _, files in os.walk(store_path):
+        blobs += [
+            os.path.join(root, file) for file in files if not file.endswith(".tmp")
+        ]
+    return blobs
+
+
+def get_referenced_inodes(view_paths: list[str]) -> dict:
+    """
+    Return the inodes of the files in the dataset views. Hard links and symbolic links point to the inode of their blob.
+
+    Args:
+        view_paths (list[str]): Paths of the dataset views.
+
+    Returns:
+        dict: Number of files of the views pointing to every (device, inode).
+    """
+    inodes = {}
+    for view_path in view_paths:
+        for root, _, files in os.walk(view_path):
+            for file in files:
+                try:
+                    stat = os.stat(os.path.join(root, file))
+                except OSError:
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                inodes[key] = inodes.get(key, 0) + 1
+    return inodes
+
+
+def collect_garbage(store_path: str, view_paths: list[str]) -> dict:
+    """
+    Remove the blobs that are not referenced by any file of the dataset views.
+
+    Args:
+        store_path (str): Path of the blob store.
+        view_paths (list[str]): Paths of all the dataset views using the store.
+
+    Returns:
+        dict: Number of blobs removed and bytes freed.
+    """
+    referenced = get_referenced_inodes(view_paths)
+    removed = 0
+    freed = 0
+    for blob_path in list_blobs(store_path):
+        stat = os.stat(blob_path)
+        if (stat.st_dev, stat.st_ino) not in referenced:
+            os.remove(blob_path)
+            removed += 1
+            freed += stat.st_size
+
+    print(f"Blobs removed: {removed}")
+    print(f"Space freed: {freed / 2**20:.2f} MiB")
+    return {"removed": removed, "freed_bytes": freed}
+
+
+def report_storage(store_path: str, view_paths: list[str]) -> dict:
+    """
+    Report the space used by the blob store against the space the dataset views would use as plain copies.
+
+    Args:
+        store_path (str): Path of the blob store.
+        view_paths (list[str]): Paths of all the dataset views using the store.
+
+    Returns:
+        dict: Number of blobs and files, stored bytes, logical bytes and bytes saved.
+    """
+    referenced = get_referenced_inodes(view_paths)
+    blobs = 0
+    files = 0
+    stored = 0
+    logical = 0
+    for blob_path in list_blobs(store_path):
+        stat = os.stat(blob_path)
+        links = referenced.get((stat.st_dev, stat.st_ino), 0)
+        blobs += 1
+        files += links
+        stored += stat.st_size
+        logical += stat.st_size * links
+
+    print(f"Blobs: {blobs}")
+    print(f"Files in views: {files}")
+    print(f"Stored: {stored / 2**20:.2f} MiB")
+    print(f"Logical: {logical / 2**20:.2f} MiB")
+    print(f"Saved: {(logical - stored) / 2**20:.2f} MiB")
+    return {
+        "blobs": blobs,
+        "files": files,
+        "stored_bytes": stored,
+        "logical_bytes": logical,
+        "saved_bytes": logical - stored,
+    }
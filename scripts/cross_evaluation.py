@@ -0,0 +1,132 @@
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from ultralytics.utils.ops import xywh2xyxy
+from .evalute_datasets import get_boxes_from_file, score_boxes
+from .manage_data import create_dir, detect_files
+from .yolo_utils import get_best_model, get_device
+
+
+def decode_resized(image_path: str, image_size: int) -> np.ndarray:
+    """
+    Decode an image and resize it so its longest side is image_size, keeping the aspect ratio so the normalized boxes do not change.
+
+    Args:
+        image_path (str): Path of the image.
+        image_size (int): Inference image size.
+
+    Returns:
+        np.ndarray: Decoded BGR image.
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(f"Image {image_path} can not be read.")
+    scale = image_size / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(
+            image,
+            (round(image.shape[1] * scale), round(image.shape[0] * scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+    return image
+
+
+def cross_evaluate(
+    models: dict,
+    datasets: dict,
+    output_path: str,
+    image_size: int = 640,
+    batch_size: int = 8,
+    chunk_size: int = 256,
+    iou_threshold: float = 0.75,
+    workers: int | None = None,
+) -> dict:
+    """
+    Evaluate every model on the test split of every dataset. The test images are decoded once, a chunk at a time, and every model (loaded once) runs over the same decoded chunk, so the decoding cost does not grow with the number of models. The metrics of score_boxes are saved as a generalization matrix (models in rows, datasets in columns).
+
+    Args:
+        models (dict): Path to the model output of every model, keyed by its name.
+        datasets (dict): Path of every dataset with the images and labels folders, keyed by its name.
+        output_path (str): Path to save cross_evaluation.json and one CSV matrix per metric.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        batch_size (int, optional): Images per inference call. Defaults to 8.
+        chunk_size (int, optional): Images decoded and kept in memory at the same time. Defaults to 256.
+        iou_threshold (float, optional): IoU threshold of the evaluation. Defaults to 0.75.
+        workers (int | None, optional): Threads decoding images. Defaults to the number of cores.
+
+    Returns:
+        dict: Metrics of every model on every dataset.
+    """
+    create_dir(output_path)
+    device = get_device()
+    loaded_models = {name: get_best_model(path) for name, path in models.items()}
+    matrix = {name: {} for name in models}
+
+    for dataset, dataset_path in datasets.items():
+        print(f"Evaluating on {dataset}")
+        image_paths = detect_files(
+            f"{dataset_path}/images/test", [".png", ".jpg", ".tif"]
+        )
+        gt_boxes_per_image = []
+        for image_path in image_paths:
+            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            gt_file = f"{dataset_path}/labels/test/{base_name}.txt"
+            gt_boxes_per_image.append(
+                get_boxes_from_file(gt_file) if os.path.exists(gt_file) else []
+            )
+
+        pred_boxes_per_image = {name: [] for name in models}
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for start in range(0, len(image_paths), chunk_size):
+                chunk = list(
+                    executor.map(
+                        lambda path: decode_resized(path, image_size),
+                        image_paths[start : start + chunk_size],
+                    )
+                )
+                # Every model runs over the same decoded images
+                for name, model in loaded_models.items():
+                    for i in range(0, len(chunk), batch_size):
+                        results = model.predict(
+                            chunk[i : i + batch_size],
+                            imgsz=image_size,
+                            device=device,
+                            verbose=False,
+                        )
+                        pred_boxes_per_image[name] += [
+                            list(xywh2xyxy(result.boxes.xywhn.cpu()))
+                            for result in results
+                        ]
+
+        for name in models:
+            matrix[name][dataset] = score_boxes(
+                gt_boxes_per_image, pred_boxes_per_image[name], iou_threshold
+            )
+
+    with open(os.path.join(output_path, "cross_evaluation.json"), "w") as file:
+        json.dump(matrix, file, indent=2)
+
+    for metric in ["sensibility", "fp_rate"]:
+        with open(os.path.join(output_path, f"{metric}_matrix.csv"), "w") as file:
+            writer = csv.writer(file)
+            writer.writerow(["model"] + list(datasets))
+            for name in models:
+                writer.writerow(
+                    [name] + [matrix[name][dataset][metric] for dataset in datasets]
+                )
+
+    print("Sensibility (%) of every model (rows) on every dataset (columns)")
+    print(f"{'':<25}" + "".join(f"{dataset[:12]:>13}" for dataset in datasets))
+    for name in models:
+        print(
+            f"{name:<25}"
+            + "".join(
+                f"{matrix[name][dataset]['sensibility'] * 100:>13.2f}"
+                for dataset in datasets
+            )
+        )
+
+    return matrix
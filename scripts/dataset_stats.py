@@ -0,0 +1,180 @@
+import json
+import os
+import numpy as np
+from .prediction_store import load_labels
+
+# Bins of the histograms of box size (box area over image area) and aspect ratio (width / height)
+SIZE_BINS = [0.0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+ASPECT_BINS = [0.0, 0.25, 0.5, 0.75, 1.0, 1.33, 2.0, 4.0, np.inf]
+
+
+def scan_split(images_path: str, labels_path: str, image_ext: list[str]) -> dict:
+    """
+    Scan the images and labels of a split once and compute its statistics.
+
+    Args:
+        images_path (str): Path to the images of the split.
+        labels_path (str): Path to the labels of the split, a directory of label files or a prediction store.
+        image_ext (list[str]): Extensions of the images.
+
+    Returns:
+        dict: Number of images, polyps, images without polyps and histograms of box size and aspect ratio.
+    """
+    images = 0
+    if os.path.isdir(images_path):
+        with os.scandir(images_path) as entries:
+            images = sum(
+                1
+                for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(tuple(image_ext))
+            )
+
+    labels = load_labels(labels_path) if os.path.exists(labels_path) else {}
+    return summarize_labels(images, list(labels.values()))
+
+
+def summarize_labels(images: int, labels: list[np.ndarray]) -> dict:
+    """
+    Compute the statistics of a set of images from their label rows.
+
+    Args:
+        images (int): Number of images.
+        labels (list[np.ndarray]): Rows (class, x_center, y_center, width, height) of every labeled image.
+
+    Returns:
+        dict: Number of images, polyps, images without polyps and histograms of box size and aspect ratio.
+    """
+    boxes = []
+    labeled_images = 0
+    for rows in labels:
+        boxes += rows[:, 1:5].tolist()
+        labeled_images += len(rows) > 0
+
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    widths, heights = boxes[:, 2], boxes[:, 3]
+    aspect = np.divide(widths, heights, out=np.zeros_like(widths), where=heights > 0)
+    return {
+        "images": images,
+        "polyps": len(boxes),
+        "images_without_polyps": max(images - labeled_images, 0),
+        "size_histogram": np.histogram(widths * heights, SIZE_BINS)[0].tolist(),
+        "aspect_histogram": np.histogram(aspect, ASPECT_BINS)[0].tolist(),
+    }
+
+
+def sum_stats(stats: list[dict]) -> dict:
+    """
+    Add up the statistics of disjoint sets of images, like the splits or the shards of a dataset.
+
+    Args:
+        stats (list[dict]): Statistics returned by summarize_labels.
+
+    Returns:
+        dict: Statistics of all the images.
+    """
+    return {
+        field: (
+            np.sum([item[field] for item in stats], axis=0).tolist()
+            if field.endswith("histogram")
+            else sum(item[field] for item in stats)
+        )
+        for field in stats[0]
+    }
+
+
+def get_cache_key(paths: list[str]) -> list:
+    """
+    Return the modification times of the directories of a dataset, they change whenever a file is added, removed or renamed.
+
+    Args:
+        paths (list[str]): Directories (or prediction stores) of the dataset.
+
+    Returns:
+        list: Modification time of every path, None if it does not exist.
+    """
+    return [
+        os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths
+    ]
+
+
+def get_dataset_stats(
+    dataset_path: str,
+    splits: list[str] | None = None,
+    image_ext: list[str] | None = None,
+    use_cache: bool = True,
+) -> dict:
+    """
+    Return the statistics of every split of a dataset, scanning it once and caching the result in stats_cache.json. The cache is reused while the modification times of the split directories do not change.
+
+    Args:
+        dataset_path (str): Path of the dataset with the images and labels folders.
+        splits (list[str] | None, optional): Splits to scan. Defaults to ["train", "val", "test"].
+        image_ext (list[str] | None, optional): Extensions of the images. Defaults to [".jpg", ".png", ".tif"].
+        use_cache (bool, optional): Reuse the cached statistics when they are up to date. Defaults to True.
+
+    Returns:
+        dict: Statistics of every split and the total of the dataset.
+    """
+    splits = splits or ["train", "val", "test"]
+    image_ext = image_ext or [".jpg", ".png", ".tif"]
+    paths = [
+        os.path.join(dataset_path, folder, split)
+        for split in splits
+        for folder in ["images", "labels"]
+    ]
+    key = get_cache_key(paths)
+
+    cache_path = os.path.join(dataset_path, "stats_cache.json")
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            cache = json.load(file)
+        if cache["key"] == key and cache["splits"] == splits:
+            return cache["stats"]
+
+    stats = {
+        split: scan_split(
+            os.path.join(dataset_path, "images", split),
+            os.path.join(dataset_path, "labels", split),
+            image_ext,
+        )
+        for split in splits
+    }
+    stats["total"] = sum_stats([stats[split] for split in splits])
+
+    if os.path.isdir(dataset_path):
+        with open(cache_path, "w") as file:
+            json.dump({"key": key, "splits": splits, "stats": stats}, file)
+    return stats
+
+
+def print_stats_table(datasets_path: str, datasets: list[str]) -> list[dict]:
+    """
+    Print a table with the statistics of several datasets.
+
+    Args:
+        datasets_path (str): Path where the datasets are located.
+        datasets (list[str]): Names of the datasets.
+
+    Returns:
+        list[dict]: One row per dataset and split with its statistics.
+    """
+    rows = []
+    for dataset in datasets:
+        stats = get_dataset_stats(os.path.join(datasets_path, dataset))
+        for split, split_stats in stats.items():
+            rows.append({"dataset": dataset, "split": split, **split_stats})
+
+    print(f"{'Dataset':<25} {'Split':<6} {'Images':>7} {'Polyps':>7} {'Empty':>6}")
+    for row in rows:
+        print(
+            f"{row['dataset']:<25} {row['split']:<6} {row['images']:>7} "
+            f"{row['polyps']:>7} {row['images_without_polyps']:>6}"
+        )
+
+    print(f"Size bins (box area / image area): {SIZE_BINS}")
+    print(f"Aspect bins (width / height): {ASPECT_BINS}")
+    for row in rows:
+        if row["split"] == "total":
+            print(f"{row['dataset']:<25} size {row['size_histogram']}")
+            print(f"{'':<25} aspect {row['aspect_histogram']}")
+    return rows
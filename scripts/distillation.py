@@ -0,0 +1,261 @@
+import json
+import os
+import torch
+import torch.nn.functional as F
+import yaml
+from ultralytics import YOLO
+from ultralytics.nn.tasks import yaml_model_load
+from ultralytics.utils.loss import v8DetectionLoss
+from ultralytics.utils.torch_utils import de_parallel
+from .image_size_sweep import sweep_image_sizes
+from .manage_data import create_dir
+
+
+def create_student_yaml(
+    output_path: str,
+    base_cfg: str = "yolo11n.yaml",
+    depth_multiple: float = 0.33,
+    width_multiple: float = 0.125,
+    max_channels: int = 1024,
+) -> str:
+    """
+    Create the model YAML of a student narrower (and shallower) than the base architecture, with a single scale so ultralytics uses it.
+
+    Args:
+        output_path (str): Directory to save the YAML file.
+        base_cfg (str, optional): Base architecture. Defaults to "yolo11n.yaml".
+        depth_multiple (float, optional): Depth multiple of the student, YOLO11n uses 0.5. Defaults to 0.33.
+        width_multiple (float, optional): Width multiple of the student, YOLO11n uses 0.25. Defaults to 0.125.
+        max_channels (int, optional): Maximum channels of a layer. Defaults to 1024.
+
+    Returns:
+        str: Path of the YAML file.
+    """
+    cfg = yaml_model_load(base_cfg)
+    cfg.pop("scale", None)
+    cfg.pop("yaml_file", None)
+    cfg["scales"] = {"student": [depth_multiple, width_multiple, max_channels]}
+
+    create_dir(output_path)
+    # The name must not look like yolo11n.yaml or ultralytics guesses a scale from it
+    cfg_path = os.path.join(
+        output_path, f"student_d{depth_multiple}_w{width_multiple}.yaml"
+    )
+    with open(cfg_path, "w") as file:
+        yaml.dump(cfg, file, sort_keys=False)
+    return cfg_path
+
+
+class DistillationLoss:
+    """
+    Detection loss of the student plus the distance between its raw outputs and the teacher ones on the same images: binary cross-entropy against the softened class probabilities of the teacher and KL divergence against the softened box distributions (DFL bins) of the teacher.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        teacher: torch.nn.Module,
+        alpha: float = 1.0,
+        temperature: float = 2.0,
+    ):
+        """
+        Args:
+            model (torch.nn.Module): Student model being trained.
+            teacher (torch.nn.Module): Teacher model, in evaluation mode and on the same device.
+            alpha (float, optional): Weight of the distillation term. Defaults to 1.0.
+            temperature (float, optional): Temperature of the soft targets. Defaults to 2.0.
+        """
+        self.detection_loss = v8DetectionLoss(model)
+        self.teacher = teacher
+        self.alpha = alpha
+        self.temperature = temperature
+
+    def distillation_term(
+        self, student_feats: list, teacher_feats: list
+    ) -> torch.Tensor:
+        """
+        Return the distillation term averaged over the levels of the detection head.
+
+        Args:
+            student_feats (list): Raw outputs of every level of the student head.
+            teacher_feats (list): Raw outputs of every level of the teacher head.
+
+        Returns:
+            torch.Tensor: Distillation term.
+        """
+        nc = self.detection_loss.nc
+        reg_max = self.detection_loss.reg_max
+        temperature = self.temperature
+        term = 0
+        for student, teacher in zip(student_feats, teacher_feats):
+            batch_size = student.shape[0]
+            student_box, student_cls = student.view(
+                batch_size, 4 * reg_max + nc, -1
+            ).split((4 * reg_max, nc), 1)
+            teacher_box, teacher_cls = teacher.view(
+                batch_size, 4 * reg_max + nc, -1
+            ).split((4 * reg_max, nc), 1)
+            cls_term = F.binary_cross_entropy_with_logits(
+                student_cls / temperature, torch.sigmoid(teacher_cls / temperature)
+            )
+            box_term = (
+                F.kl_div(
+                    F.log_softmax(
+                        student_box.view(batch_size, 4, reg_max, -1) / temperature, 2
+                    ),
+                    F.softmax(
+                        teacher_box.view(batch_size, 4, reg_max, -1) / temperature, 2
+                    ),
+                    reduction="batchmean",
+                )
+                / student_box.shape[-1]
+            )
+            term = term + (cls_term + box_term) * temperature**2
+        return term / len(student_feats)
+
+    def __call__(self, preds, batch: dict) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Return the loss (box, cls and dfl scaled by the batch size, the distillation term is added once, to cls) and the detached items to log (box, cls, dfl and distillation).
+        """
+        loss, loss_items = self.detection_loss(preds, batch)
+        student_feats = preds[1] if isinstance(preds, tuple) else preds
+        with torch.no_grad():
+            teacher_preds = self.teacher(batch["img"])
+        teacher_feats = (
+            teacher_preds[1] if isinstance(teacher_preds, tuple) else teacher_preds
+        )
+        term = self.alpha * self.distillation_term(student_feats, teacher_feats)
+        # The trainer sums the three components, adding the scalar to all of them would count it three times
+        loss = loss.clone()
+        loss[1] = loss[1] + term * batch["img"].shape[0]
+        return loss, torch.cat((loss_items, term.detach().view(1)))
+
+
+def distill_model(
+    teacher_path: str,
+    yaml_path: str,
+    name: str,
+    project: str,
+    student_cfg: str | None = None,
+    epoches: int = 100,
+    image_size: int = 640,
+    batch_size: int = 8,
+    alpha: float = 1.0,
+    temperature: float = 2.0,
+    device: str = "cpu",
+    workers: int = 8,
+) -> str:
+    """
+    Train a student model on a dataset with the soft targets of an already trained teacher. The distillation loss is installed on the student when the training starts, the teacher runs on the same (possibly lower resolution) training images, so both heads have the same grid. The student may be narrower (create_student_yaml) and trained at a lower image_size than the teacher. The distillation term is logged as distill_loss in results.csv, for training and validation.
+
+    Args:
+        teacher_path (str): Path to the model output of the teacher in the trainin model method.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        name (str): Name of the student.
+        project (str): Project to save the student.
+        student_cfg (str | None, optional): Model YAML of the student. Defaults to the one of create_student_yaml.
+        epoches (int, optional): Number of epoches. Defaults to 100.
+        image_size (int, optional): Training image size of the student. Defaults to 640.
+        batch_size (int, optional): Size of the batch. Defaults to 8.
+        alpha (float, optional): Weight of the distillation term. Defaults to 1.0.
+        temperature (float, optional): Temperature of the soft targets. Defaults to 2.0.
+        device (str, optional): Device to train on. Defaults to "cpu".
+        workers (int, optional): Number of dataloader workers. Defaults to 8.
+
+    Returns:
+        str: Path to the model output of the student.
+    """
+    student_path = os.path.join(project, name)
+    student_cfg = student_cfg or create_student_yaml(student_path)
+
+    state = {}
+
+    def on_train_start(trainer) -> None:
+        teacher = (
+            YOLO(f"{teacher_path}/weights/best.pt").model.float().to(trainer.device)
+        )
+        teacher.eval()
+        for parameter in teacher.parameters():
+            parameter.requires_grad = False
+        student = de_parallel(trainer.model)
+        student.criterion = DistillationLoss(student, teacher, alpha, temperature)
+        trainer.loss_names = (*trainer.loss_names, "distill_loss")
+        state.update(trainer=trainer, teacher=teacher)
+
+    def on_val_start(validator) -> None:
+        # The validation loss has the same items as the training one
+        if validator.training:
+            ema = de_parallel(state["trainer"].ema.ema)
+            ema.criterion = DistillationLoss(ema, state["teacher"], alpha, temperature)
+
+    def on_val_end(validator) -> None:
+        # The EMA model is saved in the checkpoints, without the teacher
+        if validator.training:
+            de_parallel(state["trainer"].ema.ema).criterion = None
+
+    model = YOLO(student_cfg)
+    model.add_callback("on_train_start", on_train_start)
+    model.add_callback("on_val_start", on_val_start)
+    model.add_callback("on_val_end", on_val_end)
+    model.train(
+        data=yaml_path,
+        epochs=epoches,
+        imgsz=image_size,
+        batch=batch_size,
+        device=device,
+        workers=workers,
+        amp=False,
+        name=name,
+        project=project,
+        exist_ok=True,
+    )
+    return student_path
+
+
+def compare_student_teacher(
+    teacher_path: str,
+    student_path: str,
+    dataset_path: str,
+    image_sizes: list[int] | None = None,
+    tolerance: float = 0.02,
+) -> dict:
+    """
+    Run the image size sweep (CPU latency and evaluation on images/test) on the teacher and the student and save the comparison in distillation_report.json in the student path.
+
+    Args:
+        teacher_path (str): Path to the model output of the teacher.
+        student_path (str): Path to the model output of the student.
+        dataset_path (str): Path of the dataset with the images and labels folders.
+        image_sizes (list[int] | None, optional): Image sizes to test. Defaults to the ones of sweep_image_sizes.
+        tolerance (float, optional): Maximum sensibility loss allowed for the recommended size. Defaults to 0.02.
+
+    Returns:
+        dict: Sweep of the teacher and the student.
+    """
+    report = {
+        "teacher": sweep_image_sizes(
+            teacher_path, dataset_path, image_sizes, tolerance
+        ),
+        "student": sweep_image_sizes(
+            student_path, dataset_path, image_sizes, tolerance
+        ),
+    }
+
+    print(
+        f"{'Image size':>10} {'Teacher ms':>11} {'Student ms':>11} "
+        f"{'Teacher S%':>11} {'Student S%':>11}"
+    )
+    for teacher_row, student_row in zip(
+        report["teacher"]["rows"], report["student"]["rows"]
+    ):
+        print(
+            f"{teacher_row['image_size']:>10} "
+            f"{teacher_row['latency_per_image_ms']:>11.2f} "
+            f"{student_row['latency_per_image_ms']:>11.2f} "
+            f"{teacher_row['sensibility'] * 100:>11.2f} "
+            f"{student_row['sensibility'] * 100:>11.2f}"
+        )
+
+    with open(os.path.join(student_path, "distillation_report.json"), "w") as file:
+        json.dump(report, file, indent=2)
+    return report
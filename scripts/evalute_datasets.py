@@ -1,6 +1,9 @@
 from .manage_data import detect_files
+from .prediction_store import is_prediction_store, load_labels, read_prediction_store
+from .mask_store import open_masks, read_mask
 from ultralytics.utils.ops import xywh2xyxy
 import torch
+import cv2
 import numpy as np
 import os
 
@@ -62,14 +65,21 @@ def get_boxes_from_file(source_path: str) -> list:
     return boxes
 
 
-def evalute_predictions(gt_path: str, pred_path: str, iou_threshold: float = 0.5):
+def score_boxes(
+    gt_boxes_per_image: list[list],
+    pred_boxes_per_image: list[list],
+    iou_threshold: float,
+) -> dict:
     """
-        Get
+    Compute the detection metrics of the predicted boxes against the ground truth boxes of a set of images.
 
     Args:
-        gt_path (str): _description_
-        pred_path (str): _description_
-        iou_threshold (float, optional): _description_. Defaults to 0.5.
+        gt_boxes_per_image (list[list]): Ground truth boxes (x1, y1, x2, y2) of every image.
+        pred_boxes_per_image (list[list]): Predicted boxes (x1, y1, x2, y2) of every image, in the same order.
+        iou_threshold (float): IoU threshold to consider a predicted box as a true positive.
+
+    Returns:
+        dict: Boxes, true positives, false positives, false negatives, sensibility and false positive rate.
     """
     # Counters
     total_gt = 0
@@ -80,21 +90,7 @@ def evalute_predictions(gt_path: str, pred_path: str, iou_threshold: float = 0.5
     total_fp = 0
     total_fn = 0
 
-    # Sensibility and False Positive Rate
-    sensibility = 0
-    fp_rate = 0
-
-    gt_files = detect_files(gt_path, [".txt"])
-
-    for gt_file in gt_files:
-        # Load predicted files
-        base_name = os.path.basename(gt_file)
-        pred_file = os.path.join(pred_path, base_name)
-
-        # Load ground truth and predicted boxes per files
-        gt_boxes = get_boxes_from_file(gt_file)
-        pred_boxes = get_boxes_from_file(pred_file) if os.path.exists(pred_file) else []
-
+    for gt_boxes, pred_boxes in zip(gt_boxes_per_image, pred_boxes_per_image):
         total_gt += len(gt_boxes)
         total_pred += len(pred_boxes)
 
@@ -106,16 +102,254 @@ def evalute_predictions(gt_path: str, pred_path: str, iou_threshold: float = 0.5
             if iou == 0:
                 total_fp += 1
 
+    # Sensibility and False Positive Rate
     total_fn = total_pred - total_tp
     sensibility = total_tp / (total_tp + total_fn) if (total_tp + total_fn) > 0 else 0
     fp_rate = total_fp / total_pred if total_pred > 0 else 0
 
-    print(f"GT files: {len(gt_files)}")
+    return {
+        "images": len(gt_boxes_per_image),
+        "gt_boxes": total_gt,
+        "pred_boxes": total_pred,
+        "tp": total_tp,
+        "fp": total_fp,
+        "fn": total_fn,
+        "sensibility": sensibility,
+        "fp_rate": fp_rate,
+    }
+
+
+def print_metrics(metrics: dict) -> None:
+    """
+    Print the metrics returned by score_boxes.
+
+    Args:
+        metrics (dict): Metrics of a set of predictions.
+    """
+    print(f"GT files: {metrics['images']}")
+
+    print(f"GT boxes: {metrics['gt_boxes']}")
+    print(f"Pred boxes: {metrics['pred_boxes']}")
+    print(f"True Positives: {metrics['tp']}")
+    print(f"False Positives: {metrics['fp']}")
+    print(f"False Negatives: {metrics['fn']}")
+    print(f"Sensibility: {metrics['sensibility'] * 100:.2f} %")
+    print(f"False Positive Rate: {metrics['fp_rate'] * 100:.2f} %")
+
+
+def evalute_predictions(
+    gt_path: str, pred_path: str, iou_threshold: float = 0.5, verbose: bool = True
+) -> dict:
+    """
+    Evaluate the predicted labels of a dataset against the ground truth labels, matching the files by name.
+
+    Args:
+        gt_path (str): Path to the ground truth labels.
+        pred_path (str): Path to the predicted labels, either a directory of label files or a prediction store.
+        iou_threshold (float, optional): IoU threshold to consider a predicted box as a true positive. Defaults to 0.5.
+        verbose (bool, optional): Print the metrics. Defaults to True.
+
+    Returns:
+        dict: Metrics returned by score_boxes.
+    """
+    gt_files = detect_files(gt_path, [".txt"])
+    store = read_prediction_store(pred_path) if is_prediction_store(pred_path) else None
+
+    gt_boxes_per_image = []
+    pred_boxes_per_image = []
+    for gt_file in gt_files:
+        # Load predicted files
+        base_name = os.path.basename(gt_file)
+        pred_file = os.path.join(pred_path, base_name)
+
+        # Load ground truth and predicted boxes per files
+        gt_boxes_per_image.append(get_boxes_from_file(gt_file))
+        if store is not None:
+            rows = store.get(os.path.splitext(base_name)[0], [])
+            pred_boxes_per_image.append(
+                [xywh2xyxy(torch.tensor(row[1:5].tolist())) for row in rows]
+            )
+        else:
+            pred_boxes_per_image.append(
+                get_boxes_from_file(pred_file) if os.path.exists(pred_file) else []
+            )
+
+    metrics = score_boxes(gt_boxes_per_image, pred_boxes_per_image, iou_threshold)
+    if verbose:
+        print_metrics(metrics)
+    return metrics
+
+
+def summed_area_table(layer: np.ndarray) -> np.ndarray:
+    """
+    Build the summed-area table of a binary layer, with a leading row and column of zeros.
+
+    Args:
+        layer (np.ndarray): Binary layer of shape (height, width).
+
+    Returns:
+        np.ndarray: Table of shape (height + 1, width + 1).
+    """
+    table = np.zeros((layer.shape[0] + 1, layer.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = layer.astype(np.int32).cumsum(axis=0).cumsum(axis=1)
+    return table
+
+
+def box_sums(tables: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    Sum the pixels inside every box with summed-area tables, in O(1) per box and table.
+
+    Args:
+        tables (np.ndarray): Summed-area tables of shape (k, height + 1, width + 1).
+        boxes (np.ndarray): Boxes (x1, y1, x2, y2) in pixels of shape (n, 4), the second corner excluded.
+
+    Returns:
+        np.ndarray: Sum of every table inside every box, of shape (k, n).
+    """
+    x1, y1, x2, y2 = boxes.T
+    return tables[:, y2, x2] - tables[:, y1, x2] - tables[:, y2, x1] + tables[:, y1, x1]
+
+
+def score_masks(
+    mask: np.ndarray,
+    rows: np.ndarray,
+    coverage_threshold: float = 0.5,
+    precision_threshold: float = 0.5,
+    min_area: int = 35,
+) -> dict:
+    """
+    Score the predicted boxes of an image against the polyps of its mask. A summed-area table is built for the whole mask and for every polyp (connected component of at least min_area pixels, as in detect_object) cropped to its bounding box, so the polyp pixels inside all the boxes are computed at once. The scoring is vectorized over the boxes of one image, the images of a dataset are scored one by one. A box hits a polyp when it covers at least coverage_threshold of the polyp pixels and at least precision_threshold of the box is that polyp.
+
+    Args:
+        mask (np.ndarray): Mask of the image, every non zero pixel is foreground.
+        rows (np.ndarray): Predicted rows (class, x_center, y_center, width, height[, conf]) with normalized coordinates.
+        coverage_threshold (float, optional): Minimum fraction of the polyp covered by a box. Defaults to 0.5.
+        precision_threshold (float, optional): Minimum fraction of the box on the polyp. Defaults to 0.5.
+        min_area (int, optional): Minimum area of a polyp in pixels. Defaults to 35.
+
+    Returns:
+        dict: Polyps, boxes, polyps hit, boxes without a hit and best coverage of every polyp and precision of every box.
+    """
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+        (mask > 0).astype(np.uint8)
+    )
+    polyps = [i for i in range(1, num_labels) if stats[i][cv2.CC_STAT_AREA] >= min_area]
+    rows = np.asarray(rows, dtype=np.float64)
+
+    height, width = mask.shape[:2]
+    x_center, y_center, box_width, box_height = rows[:, 1:5].T
+    boxes = np.stack(
+        [
+            np.floor((x_center - box_width / 2) * width),
+            np.floor((y_center - box_height / 2) * height),
+            np.ceil((x_center + box_width / 2) * width),
+            np.ceil((y_center + box_height / 2) * height),
+        ],
+        axis=1,
+    )
+    boxes = np.clip(boxes, 0, [width, height, width, height]).astype(np.intp)
+    box_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    # The table of a polyp only spans its bounding box, the boxes are clipped to it
+    inside = np.zeros((len(polyps) + 1, len(boxes)), dtype=np.int64)
+    for k, i in enumerate(polyps):
+        left, top, crop_width, crop_height = stats[i][:4]
+        table = summed_area_table(
+            labels[top : top + crop_height, left : left + crop_width] == i
+        )
+        crop = np.clip(
+            boxes - [left, top, left, top],
+            0,
+            [crop_width, crop_height, crop_width, crop_height],
+        )
+        inside[k] = box_sums(table[None], crop)[0]
+    inside[-1] = box_sums(summed_area_table(labels > 0)[None], boxes)[0]
+
+    polyp_areas = np.array([stats[i][cv2.CC_STAT_AREA] for i in polyps])
+    coverage = inside[:-1] / polyp_areas[:, None] if polyps else inside[:-1]
+    precision = inside[:-1] / np.maximum(box_areas, 1)
+    hits = (coverage >= coverage_threshold) & (precision >= precision_threshold)
+
+    return {
+        "polyps": len(polyps),
+        "boxes": len(boxes),
+        "polyps_hit": int(hits.any(axis=1).sum()),
+        "boxes_without_hit": int((~hits.any(axis=0)).sum()),
+        "coverage": coverage.max(axis=1, initial=0).tolist(),
+        "precision": (inside[-1] / np.maximum(box_areas, 1)).tolist(),
+    }
+
+
+def evaluate_with_masks(
+    gt_path: str,
+    masks_path: str,
+    pred_path: str,
+    coverage_threshold: float = 0.5,
+    precision_threshold: float = 0.5,
+    min_area: int = 35,
+    verbose: bool = True,
+) -> dict:
+    """
+    Evaluate the predicted labels of a dataset against the pixels of the ground truth masks instead of the boxes derived from them, so a box that covers most of an irregular polyp is a hit even if its IoU with the polyp box is low. The images are the ones of the ground truth labels, matched with the masks and predictions by name.
+
+    Args:
+        gt_path (str): Path to the ground truth labels, used to select the images of the split.
+        masks_path (str): Path to the masks, a directory of mask images or a mask store.
+        pred_path (str): Path to the predicted labels, either a directory of label files or a prediction store.
+        coverage_threshold (float, optional): Minimum fraction of the polyp covered by a box. Defaults to 0.5.
+        precision_threshold (float, optional): Minimum fraction of the box on the polyp. Defaults to 0.5.
+        min_area (int, optional): Minimum area of a polyp in pixels. Defaults to 35.
+        verbose (bool, optional): Print the metrics. Defaults to True.
+
+    Returns:
+        dict: Metrics with the keys of score_boxes plus the mean coverage of the polyps and mean precision of the boxes.
+    """
+    masks = open_masks(masks_path)
+    predictions = load_labels(pred_path)
+    names = [
+        os.path.splitext(os.path.basename(gt_file))[0]
+        for gt_file in detect_files(gt_path, [".txt"])
+    ]
+
+    images = 0
+    totals = {"polyps": 0, "boxes": 0, "polyps_hit": 0, "boxes_without_hit": 0}
+    coverage = []
+    precision = []
+    for name in names:
+        mask = read_mask(masks, name)
+        if mask is None:
+            print(f"Mask of {name} not found")
+            continue
+        result = score_masks(
+            mask,
+            predictions.get(name, np.zeros((0, 5))),
+            coverage_threshold,
+            precision_threshold,
+            min_area,
+        )
+        images += 1
+        for key in totals:
+            totals[key] += result[key]
+        coverage += result["coverage"]
+        precision += result["precision"]
 
-    print(f"GT boxes: {total_gt}")
-    print(f"Pred boxes: {total_pred}")
-    print(f"True Positives: {total_tp}")
-    print(f"False Positives: {total_fp}")
-    print(f"False Negatives: {total_fn}")
-    print(f"Sensibility: {sensibility * 100:.2f} %")
-    print(f"False Positive Rate: {fp_rate * 100:.2f} %")
+    tp = totals["polyps_hit"]
+    metrics = {
+        "images": images,
+        "gt_boxes": totals["polyps"],
+        "pred_boxes": totals["boxes"],
+        "tp": tp,
+        "fp": totals["boxes_without_hit"],
+        "fn": totals["polyps"] - tp,
+        "sensibility": tp / totals["polyps"] if totals["polyps"] else 0,
+        "fp_rate": (
+            totals["boxes_without_hit"] / totals["boxes"] if totals["boxes"] else 0
+        ),
+        "mean_coverage": float(np.mean(coverage)) if coverage else 0.0,
+        "mean_precision": float(np.mean(precision)) if precision else 0.0,
+    }
+    if verbose:
+        print_metrics(metrics)
+        print(f"Mean polyp coverage: {metrics['mean_coverage'] * 100:.2f} %")
+        print(f"Mean box precision: {metrics['mean_precision'] * 100:.2f} %")
+    return metrics
@@ -0,0 +1,176 @@
+import json
+import os
+import numpy as np
+from ultralytics import YOLO
+from .benchmark_utils import load_images, measure_latency, sample_images
+from .evalute_datasets import calculate_iou
+from .yolo_utils import get_best_model, get_device
+
+# Formats that accept a dynamic batch dimension when exported
+DYNAMIC_FORMATS = ["onnx", "openvino"]
+
+
+def get_detections(model: YOLO, image: np.ndarray, image_size: int) -> tuple:
+    """
+    Return the boxes (x1, y1, x2, y2) and confidences predicted by a model for one image.
+
+    Args:
+        model (YOLO): Model to run.
+        image (np.ndarray): Decoded image.
+        image_size (int): Inference image size.
+
+    Returns:
+        tuple: Array of boxes and array of confidences.
+    """
+    result = model.predict(image, imgsz=image_size, device="cpu", verbose=False)[0]
+    return result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()
+
+
+def check_parity(
+    reference: YOLO,
+    exported: YOLO,
+    images: list[np.ndarray],
+    image_size: int,
+    iou_threshold: float = 0.9,
+) -> dict:
+    """
+    Compare the detections of an exported model against the PyTorch model on the same images.
+
+    Args:
+        reference (YOLO): PyTorch model.
+        exported (YOLO): Exported model.
+        images (list[np.ndarray]): Decoded images to compare on.
+        image_size (int): Inference image size.
+        iou_threshold (float, optional): Minimum IoU for two boxes to be the same detection. Defaults to 0.9.
+
+    Returns:
+        dict: Images with the same number of boxes, matched boxes, mean IoU and max confidence difference.
+    """
+    same_count = 0
+    total_boxes = 0
+    matched_boxes = 0
+    ious = []
+    max_conf_diff = 0.0
+
+    for image in images:
+        ref_boxes, ref_conf = get_detections(reference, image, image_size)
+        exp_boxes, exp_conf = get_detections(exported, image, image_size)
+        same_count += len(ref_boxes) == len(exp_boxes)
+        total_boxes += len(ref_boxes)
+
+        # Match every reference box with the exported box of highest IoU
+        for ref_box, conf in zip(ref_boxes, ref_conf):
+            if len(exp_boxes) == 0:
+                continue
+            box_ious = [calculate_iou(ref_box, exp_box) for exp_box in exp_boxes]
+            best = int(np.argmax(box_ious))
+            ious.append(box_ious[best])
+            if box_ious[best] >= iou_threshold:
+                matched_boxes += 1
+                max_conf_diff = max(max_conf_diff, abs(float(conf - exp_conf[best])))
+
+    return {
+        "images": len(images),
+        "same_box_count": same_count,
+        "reference_boxes": total_boxes,
+        "matched_boxes": matched_boxes,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "max_conf_diff": max_conf_diff,
+        "passed": same_count == len(images) and matched_boxes == total_boxes,
+    }
+
+
+def export_models(
+    model_path: str,
+    formats: list[str],
+    test_images_path: str,
+    image_size: int = 640,
+    batch_sizes: list[int] | None = None,
+    sample_size: int = 32,
+) -> dict:
+    """
+    Export the best model of a training to several formats loading it once, then benchmark the latency of every artifact and check that it gives the same detections as the PyTorch model. The results are saved in export_manifest.json next to the weights.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+        formats (list[str]): Formats to export the model.
+        test_images_path (str): Path of the images used for the benchmark and the parity check.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        batch_sizes (list[int], optional): Batch sizes to benchmark. Defaults to [1, 4, 8].
+        sample_size (int, optional): Number of test images to use. Defaults to 32.
+
+    Returns:
+        dict: Manifest with the path, size, latency and parity of every format.
+    """
+    batch_sizes = batch_sizes or [1, 4, 8]
+    best_model = get_best_model(model_path)
+    images = load_images(sample_images(test_images_path, sample_size))
+
+    manifest = {
+        "model": f"{model_path}/weights/best.pt",
+        "image_size": image_size,
+        "images": len(images),
+        "formats": {
+            "pytorch": {
+                "path": f"{model_path}/weights/best.pt",
+                "size_bytes": os.path.getsize(f"{model_path}/weights/best.pt"),
+                "latency": [
+                    measure_latency(best_model, images, batch_size, image_size)
+                    for batch_size in batch_sizes
+                ],
+            }
+        },
+    }
+
+    for format in formats:
+        print(f"Exporting {model_path} to {format}")
+        try:
+            artifact = best_model.export(
+                format=format,
+                imgsz=image_size,
+                dynamic=format in DYNAMIC_FORMATS,
+                device=get_device(),
+            )
+        except Exception as e:
+            print(f"Error to export {model_path} to {format}: {e}")
+            manifest["formats"][format] = {"error": str(e)}
+            continue
+
+        entry = {"path": str(artifact)}
+        entry["size_bytes"] = (
+            sum(
+                os.path.getsize(os.path.join(root, file))
+                for root, _, files in os.walk(artifact)
+                for file in files
+            )
+            if os.path.isdir(artifact)
+            else os.path.getsize(artifact)
+        )
+
+        try:
+            exported_model = YOLO(str(artifact), task="detect")
+        except Exception as e:
+            print(f"Error to load {artifact}: {e}")
+            entry["error"] = str(e)
+            manifest["formats"][format] = entry
+            continue
+
+        # Static formats can fail with batches bigger than the exported one
+        entry["latency"] = []
+        for batch_size in batch_sizes:
+            try:
+                entry["latency"].append(
+                    measure_latency(exported_model, images, batch_size, image_size)
+                )
+            except Exception as e:
+                entry["latency"].append({"batch_size": batch_size, "error": str(e)})
+
+        entry["parity"] = check_parity(best_model, exported_model, images, image_size)
+        manifest["formats"][format] = entry
+
+    manifest_path = f"{model_path}/weights/export_manifest.json"
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    print(f"Export manifest created at {manifest_path}")
+
+    return manifest
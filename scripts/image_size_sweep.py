@@ -0,0 +1,115 @@
+import csv
+import os
+from .benchmark_utils import (
+    load_images,
+    measure_latency,
+    predict_and_evaluate,
+    sample_images,
+)
+from .manage_data import create_dir
+from .yolo_utils import get_best_model
+
+
+def pareto_front(rows: list[dict]) -> list[dict]:
+    """
+    Mark the settings that are not beaten by another one in both latency and sensibility.
+
+    Args:
+        rows (list[dict]): Rows of the sweep with latency_per_image_ms and sensibility.
+
+    Returns:
+        list[dict]: Same rows with the pareto key set.
+    """
+    for row in rows:
+        row["pareto"] = not any(
+            other["latency_per_image_ms"] <= row["latency_per_image_ms"]
+            and other["sensibility"] >= row["sensibility"]
+            and (
+                other["latency_per_image_ms"] < row["latency_per_image_ms"]
+                or other["sensibility"] > row["sensibility"]
+            )
+            for other in rows
+        )
+    return rows
+
+
+def sweep_image_sizes(
+    model_path: str,
+    dataset_path: str,
+    image_sizes: list[int] | None = None,
+    tolerance: float = 0.02,
+    sample_size: int = 32,
+    batch_size: int = 8,
+    iou_threshold: float = 0.75,
+) -> dict:
+    """
+    Run the best model of a training at several inference image sizes, measuring the latency and throughput on CPU and the metrics of evalute_predictions on images/test. The smallest size whose sensibility stays within the tolerance of the best one is recommended. The table is saved as imgsz_sweep.csv in the model path.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+        dataset_path (str): Path of the dataset with the images and labels folders.
+        image_sizes (list[int] | None, optional): Image sizes to test. Defaults to [320, 384, 448, 512, 576, 640].
+        tolerance (float, optional): Maximum sensibility loss allowed for the recommendation (0.02 = 2 points). Defaults to 0.02.
+        sample_size (int, optional): Number of test images used to measure the latency. Defaults to 32.
+        batch_size (int, optional): Batch size used to measure the throughput. Defaults to 8.
+        iou_threshold (float, optional): IoU threshold of the evaluation. Defaults to 0.75.
+
+    Returns:
+        dict: Rows of the sweep and the recommended image size.
+    """
+    image_sizes = sorted(image_sizes or [320, 384, 448, 512, 576, 640])
+    sweep_path = os.path.join(model_path, "imgsz_sweep")
+    create_dir(sweep_path)
+
+    model = get_best_model(model_path)
+    images_test = f"{dataset_path}/images/test"
+    labels_test = f"{dataset_path}/labels/test"
+    images = load_images(sample_images(images_test, sample_size))
+
+    rows = []
+    for image_size in image_sizes:
+        print(f"Evaluating {model_path} at {image_size}px")
+        latency = measure_latency(model, images, 1, image_size)
+        throughput = measure_latency(model, images, batch_size, image_size)
+        metrics = predict_and_evaluate(
+            model,
+            images_test,
+            labels_test,
+            name=f"imgsz_{image_size}",
+            project=sweep_path,
+            image_size=image_size,
+            iou_threshold=iou_threshold,
+        )
+        rows.append(
+            {
+                "image_size": image_size,
+                "latency_per_image_ms": latency["latency_per_image_ms"],
+                "throughput": throughput["throughput"],
+                "sensibility": metrics["sensibility"],
+                "fp_rate": metrics["fp_rate"],
+            }
+        )
+    rows = pareto_front(rows)
+
+    best_sensibility = max(row["sensibility"] for row in rows)
+    recommended = next(
+        row["image_size"]
+        for row in rows
+        if row["sensibility"] >= best_sensibility - tolerance
+    )
+
+    with open(os.path.join(model_path, "imgsz_sweep.csv"), "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{'imgsz':>6} {'ms/img':>8} {'img/s':>8} {'sens %':>8} {'fp %':>8} pareto")
+    for row in rows:
+        print(
+            f"{row['image_size']:>6} {row['latency_per_image_ms']:>8.2f} "
+            f"{row['throughput']:>8.2f} {row['sensibility'] * 100:>8.2f} "
+            f"{row['fp_rate'] * 100:>8.2f} {'*' if row['pareto'] else ''}"
+        )
+    print(f"Recommended image size: {recommended}")
+
+    return {"rows": rows, "recommended": recommended}
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from .blob_store import hash_file
+from .manage_data import create_dir
+
+
+def get_cache_key(
+    image_bytes: bytes, model_hash: str, image_size: int, conf: float, iou: float
+) -> str:
+    """
+    Return the key of the detections of an image: the hash of its content, the hash of the model weights and the inference parameters.
+
+    Args:
+        image_bytes (bytes): Encoded content of the image file.
+        model_hash (str): Hash of the model weights.
+        image_size (int): Inference image size.
+        conf (float): Confidence threshold.
+        iou (float): IoU threshold of the NMS.
+
+    Returns:
+        str: Key of the detections.
+    """
+    image_hash = hashlib.blake2b(image_bytes, digest_size=20).hexdigest()
+    return f"{image_hash}:{model_hash}:{image_size}:{conf}:{iou}"
+
+
+def get_model_hash(model_path: str) -> str:
+    """
+    Return the hash of the best weights of a training.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+
+    Returns:
+        str: Hash of best.pt.
+    """
+    return hash_file(f"{model_path}/weights/best.pt")[:16]
+
+
+class InferenceCache:
+    """
+    Persistent cache of detections in a SQLite file, evicting the least recently used entries when its size goes over a budget.
+    """
+
+    def __init__(
+        self, cache_path: str, max_size_mb: float = 256, commit_every: int = 256
+    ):
+        """
+        Args:
+            cache_path (str): Path of the SQLite file.
+            max_size_mb (float, optional): Maximum size of the stored detections in MiB. Defaults to 256.
+            commit_every (int, optional): Puts between two commits, so a crash only loses the last ones. Defaults to 256.
+        """
+        create_dir(os.path.dirname(cache_path) or ".")
+        self.max_bytes = int(max_size_mb * 2**20)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS detections "
+            "(key TEXT PRIMARY KEY, rows BLOB, size INTEGER, last_access REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS last_access_index ON detections (last_access)"
+        )
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM detections"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Return the cached detections of a key.
+
+        Args:
+            key (str): Key returned by get_cache_key.
+
+        Returns:
+            np.ndarray | None: Rows (class, x_center, y_center, width, height, conf) or None if the key is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT rows FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE detections SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, 6)
+
+    def put(self, key: str, rows: np.ndarray) -> None:
+        """
+        Store the detections of a key, evicting old entries if the cache is over its budget.
+
+        Args:
+            key (str): Key returned by get_cache_key.
+            rows (np.ndarray): Rows (class, x_center, y_center, width, height, conf).
+        """
+        data = np.asarray(rows, dtype=np.float32).reshape(-1, 6).tobytes()
+        with self.lock:
+            previous = self.connection.execute(
+                "SELECT size FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self.total_bytes += len(data) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.connection.commit()
+                self.pending = 0
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache is at 90% of its budget.
+        """
+        target = int(self.max_bytes * 0.9)
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM detections ORDER BY last_access"
+        ).fetchall():
+            if self.total_bytes <= target:
+                break
+            self.connection.execute("DELETE FROM detections WHERE key = ?", (key,))
+            self.total_bytes -= size
+
+    def close(self) -> None:
+        """
+        Save the pending changes and close the cache.
+        """
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def report(self) -> dict:
+        """
+        Return the hits, misses and hit rate since the cache was opened.
+
+        Returns:
+            dict: Hits, misses, hit rate and size of the cache in bytes.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size_bytes": self.total_bytes,
+        }
@@ -1,7 +1,18 @@
+import hashlib
+import json
 import os
 import random
 import yaml
 import shutil
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .archive_data import is_archive_path, list_archive_dir, read_file_bytes, read_image
+from .blob_store import add_blob_bytes, link_blob, store_file
+
+# Suffix of the mask names, the stem of image_1_mask.png is image_1
+MASK_SUFFIX = "_mask"
+IMAGE_EXT = [".png", ".jpg", ".tif"]
 
 
 # Create directory in a output path
@@ -22,7 +33,7 @@ def create_dir(output_path: str) -> None:
 # Detect files in a folder an return a sorted list of files path
 def detect_files(source_path: str, files_ext: list[str]) -> list:
     """
-    Returns a sorted list of files path with some extension in a directory path
+    Returns a sorted list of files path with some extension in a directory path, the directory can be inside a zip archive (e.g. data/raw/kvasir-seg.zip/Kvasir-SEG/images)
 
     Args:
         source_path (str): Images path
@@ -31,7 +42,10 @@ def detect_files(source_path: str, files_ext: list[str]) -> list:
     Returns:
         list: Sorted list of files path
     """
-    items = os.listdir(source_path)
+    if is_archive_path(source_path):
+        items = list_archive_dir(source_path)
+    else:
+        items = os.listdir(source_path)
     flist = [
         os.path.join(source_path, item_name)
         for item_name in items
@@ -40,6 +54,53 @@ def detect_files(source_path: str, files_ext: list[str]) -> list:
     return sorted(flist)
 
 
+def get_stem(file_path: str, suffix: str = "") -> str:
+    """
+    Return the name of a file without extension and without a suffix (e.g. "_mask"), the key that joins an image with its mask and label.
+
+    Args:
+        file_path (str): Path of the file.
+        suffix (str, optional): Suffix to remove from the name. Defaults to "".
+
+    Returns:
+        str: Stem of the file.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if suffix and name.endswith(suffix):
+        return name[: -len(suffix)]
+    return name
+
+
+def get_shard(file_path: str, shards: int) -> int:
+    """
+    Return the shard of a file from a stable hash of its stem (name without extension and without the _mask suffix), so every machine assigns the same files to the same shard and an image and its mask or label always go together.
+
+    Args:
+        file_path (str): Path of the file.
+        shards (int): Number of shards.
+
+    Returns:
+        int: Shard of the file, from 0 to shards - 1.
+    """
+    stem = get_stem(file_path, MASK_SUFFIX)
+    digest = hashlib.blake2b(stem.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def in_shard(file_path: str, shard: tuple[int, int] | None) -> bool:
+    """
+    Check if a file belongs to a shard.
+
+    Args:
+        file_path (str): Path of the file.
+        shard (tuple[int, int] | None): Shard index and number of shards, None for all the files.
+
+    Returns:
+        bool: True if the file is in the shard.
+    """
+    return shard is None or get_shard(file_path, shard[1]) == shard[0]
+
+
 def count_lines_in_file(source_labels: str) -> int:
     """
     Count lines in a file
@@ -82,14 +143,49 @@ def detect_numbers_in_name(file_name: str) -> int | str:
     return int(name) if name.isdigit() else name
 
 
+def copy_file(
+    source_file: str, output_path: str, blob_store: str | None = None
+) -> None:
+    """
+    Copy a file to an output directory, through a content-addressed blob store when given so identical files are stored once. A file inside a zip archive is streamed from it without extracting the archive.
+
+    Args:
+        source_file (str): Path of the file to copy, on disk or inside an archive.
+        output_path (str): Output directory.
+        blob_store (str | None, optional): Path of the blob store. Defaults to None (plain copy).
+    """
+    output_file_path = os.path.join(output_path, os.path.basename(source_file))
+    if is_archive_path(source_file):
+        data = read_file_bytes(source_file)
+        if blob_store is None:
+            with open(output_file_path, "wb") as file:
+                file.write(data)
+        else:
+            link_blob(add_blob_bytes(blob_store, data), output_file_path)
+    elif blob_store is None:
+        shutil.copy(source_file, output_file_path)
+    else:
+        store_file(blob_store, source_file, output_file_path)
+
+
 # Copy images from the source path to the output path to save us a backup in case of corruption
-def copy_images(source_path: str, output_path: str) -> None:
+def copy_images(
+    source_path: str,
+    output_path: str,
+    blob_store: str | None = None,
+    shard: tuple[int, int] | None = None,
+) -> list[str]:
     """
     Copy images from the source path to the output path
 
     Args:
-        source_path (str): source path of the images
+        source_path (str): source path of the images, on disk or inside a zip archive
         output_path (str): output path to save the images
+        blob_store (str | None, optional): Path of the blob store to deduplicate the copies. Defaults to None.
+        shard (tuple[int, int] | None, optional): Copy only the images of a shard (index, number of shards). Defaults to None (all).
+
+    Returns:
+        list[str]: Paths of the copied images.
     """
     create_dir(output_path)
 
@@ -97,12 +193,16 @@ def copy_images(source_path: str, output_path: str) -> None:
     images = detect_files(source_path, [".png", ".jpg", ".tif"])
 
     # Copy each image to the output path
+    copied = []
     for img_path in images:
+        if not in_shard(img_path, shard):
+            continue
         try:
-            output_img_path = os.path.join(output_path, os.path.basename(img_path))
-            shutil.copy(img_path, output_img_path)
+            copy_file(img_path, output_path, blob_store)
+            copied.append(os.path.join(output_path, os.path.basename(img_path)))
         except Exception as e:
             print(f"Error to copy {img_path}: {e}")
+    return copied
 
 
 def rename_files(source_path: str, prefix: str) -> None:
@@ -167,11 +267,329 @@ def move_files(source_dir: str, dest_dir: str, files: list) -> None:
             print(f"Error moving {file}: {e}")
 
 
+def compute_dhash(image_path: str, hash_size: int = 8) -> int | None:
+    """
+    Compute the difference hash (dHash) of an image, a perceptual hash that barely changes between near-identical images.
+
+    Args:
+        image_path (str): Path of the image, on disk or inside an archive.
+        hash_size (int, optional): Side of the hash, the hash has hash_size * hash_size bits. Defaults to 8.
+
+    Returns:
+        int | None: Hash of the image or None if it can not be read.
+    """
+    # JPEG images are decoded directly at 1/8 of their size, enough for a 9x8 thumbnail
+    image = read_image(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    resized = cv2.resize(
+        image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA
+    )
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def compute_hashes(image_paths: list[str], workers: int | None = None) -> dict:
+    """
+    Compute the perceptual hash of a list of images with a pool of workers.
+
+    Args:
+        image_paths (list[str]): Paths of the images.
+        workers (int | None, optional): Number of workers. Defaults to the number of cores.
+
+    Returns:
+        dict: Hash of every image that could be read, keyed by its path.
+    """
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        hashes = executor.map(compute_dhash, image_paths)
+        return {
+            image_path: image_hash
+            for image_path, image_hash in zip(image_paths, hashes)
+            if image_hash is not None
+        }
+
+
+def find_duplicate_clusters(
+    hashes: dict, max_distance: int = 4, hash_bits: int = 64
+) -> list[list[str]]:
+    """
+    Group images whose hashes are at most max_distance bits apart using multi-index hashing: the hashes are split in max_distance + 1 chunks, so two near duplicates always share at least one identical chunk and only images in the same chunk bucket are compared.
+
+    Args:
+        hashes (dict): Hash of every image keyed by its path.
+        max_distance (int, optional): Maximum Hamming distance between two near duplicates. Defaults to 4.
+        hash_bits (int, optional): Number of bits of the hashes. Defaults to 64.
+
+    Returns:
+        list[list[str]]: Clusters with more than one image, sorted by path.
+    """
+    paths = list(hashes.keys())
+    values = [hashes[path] for path in paths]
+    parents = list(range(len(paths)))
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    # Build one bucket table per chunk of the hash
+    chunks = max_distance + 1
+    bounds = [hash_bits * i // chunks for i in range(chunks + 1)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        mask = (1 << (end - start)) - 1
+        buckets = {}
+        for i, value in enumerate(values):
+            buckets.setdefault((value >> start) & mask, []).append(i)
+
+        # Verify the candidates of every bucket with the full Hamming distance
+        for bucket in buckets.values():
+            for a in range(len(bucket)):
+                for b in range(a + 1, len(bucket)):
+                    i, j = bucket[a], bucket[b]
+                    root_i, root_j = find(i), find(j)
+                    if root_i == root_j:
+                        continue
+                    if (values[i] ^ values[j]).bit_count() <= max_distance:
+                        parents[root_j] = root_i
+
+    clusters = {}
+    for i, path in enumerate(paths):
+        clusters.setdefault(find(i), []).append(path)
+    return sorted(
+        [sorted(cluster) for cluster in clusters.values() if len(cluster) > 1]
+    )
+
+
+def report_duplicates(
+    folders: list[str], max_distance: int = 4, workers: int | None = None
+) -> list[list[str]]:
+    """
+    Find the near-duplicate images in one or several image folders, including duplicates across folders.
+
+    Args:
+        folders (list[str]): Image folders to index.
+        max_distance (int, optional): Maximum Hamming distance between two near duplicates. Defaults to 4.
+        workers (int | None, optional): Number of workers. Defaults to the number of cores.
+
+    Returns:
+        list[list[str]]: Clusters of near-duplicate images.
+    """
+    image_paths = []
+    for folder in folders:
+        image_paths += detect_files(folder, [".png", ".jpg", ".tif"])
+
+    hashes = compute_hashes(image_paths, workers)
+    clusters = find_duplicate_clusters(hashes, max_distance)
+    cross_folder = [
+        cluster
+        for cluster in clusters
+        if len({os.path.dirname(path) for path in cluster}) > 1
+    ]
+
+    print(f"Images indexed: {len(hashes)} of {len(image_paths)}")
+    print(f"Duplicate clusters: {len(clusters)}")
+    print(f"Images in clusters: {sum(len(cluster) for cluster in clusters)}")
+    print(f"Clusters across folders: {len(cross_folder)}")
+    return clusters
+
+
+def inspect_file(file_path: str, kind: str) -> dict:
+    """
+    Read a file of a dataset once and record its size, content hash and whether it can be decoded: the dimensions of images and masks, whether a mask is empty and the boxes of a label file.
+
+    Args:
+        file_path (str): Path of the file, on disk or inside an archive.
+        kind (str): "image", "mask" or "label".
+
+    Returns:
+        dict: Record of the file.
+    """
+    record = {"path": file_path, "name": get_stem(file_path), "valid": False}
+    try:
+        data = read_file_bytes(file_path)
+    except OSError:
+        return record
+    record["size"] = len(data)
+    record["hash"] = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    if kind == "label":
+        try:
+            lines = [line for line in data.decode().splitlines() if line.strip()]
+            rows = [list(map(float, line.split())) for line in lines]
+        except (UnicodeDecodeError, ValueError):
+            return record
+        record["valid"] = all(len(row) >= 5 for row in rows)
+        record["boxes"] = len(rows)
+        return record
+
+    flags = cv2.IMREAD_GRAYSCALE if kind == "mask" else cv2.IMREAD_COLOR
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if image is None:
+        return record
+    record["valid"] = True
+    record["height"], record["width"] = image.shape[:2]
+    if kind == "mask":
+        record["empty"] = not np.any(image)
+    return record
+
+
+def build_dataset_index(
+    images_path: str,
+    masks_path: str | None = None,
+    labels_path: str | None = None,
+    index_path: str | None = None,
+    shard: tuple[int, int] | None = None,
+    workers: int | None = None,
+) -> dict:
+    """
+    Scan the images, masks and labels of a dataset in one parallel pass and join them by stem (the mask names may end with "_mask"), instead of pairing two sorted listings where one missing file shifts every pair after it. Flag the orphans (a stem missing one of the given kinds), the empty masks, the unreadable files and the stems repeated inside a kind.
+
+    Args:
+        images_path (str): Path of the images, on disk or inside a zip archive.
+        masks_path (str | None, optional): Path of the masks. Defaults to None.
+        labels_path (str | None, optional): Path of the labels. Defaults to None.
+        index_path (str | None, optional): JSON file to save the index. Defaults to None.
+        shard (tuple[int, int] | None, optional): Index only the stems of a shard (index, number of shards). Defaults to None (all).
+        workers (int | None, optional): Number of workers. Defaults to the number of cores.
+
+    Returns:
+        dict: Records of every stem ("entries") and issues found ("issues").
+    """
+    sources = {"image": (images_path, IMAGE_EXT, "")}
+    if masks_path is not None:
+        sources["mask"] = (masks_path, IMAGE_EXT, MASK_SUFFIX)
+    if labels_path is not None:
+        sources["label"] = (labels_path, [".txt"], "")
+
+    files = [
+        (kind, file_path, get_stem(file_path, suffix))
+        for kind, (source_path, files_ext, suffix) in sources.items()
+        for file_path in detect_files(source_path, files_ext)
+    ]
+    files = [item for item in files if in_shard(item[1], shard)]
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        records = executor.map(lambda item: inspect_file(item[1], item[0]), files)
+
+        entries = {}
+        issues = {
+            "orphans": [],
+            "empty_masks": [],
+            "unreadable": [],
+            "duplicate_stems": [],
+        }
+        for (kind, file_path, stem), record in zip(files, records):
+            entry = entries.setdefault(stem, {})
+            if kind in entry:
+                issues["duplicate_stems"].append(file_path)
+                continue
+            entry[kind] = record
+            if not record["valid"]:
+                issues["unreadable"].append(file_path)
+            elif record.get("empty"):
+                issues["empty_masks"].append(stem)
+
+    for stem, entry in entries.items():
+        missing = [kind for kind in sources if kind not in entry]
+        if missing:
+            issues["orphans"].append({"stem": stem, "missing": missing})
+
+    index = {
+        "paths": {kind: source[0] for kind, source in sources.items()},
+        "entries": dict(sorted(entries.items())),
+        "issues": issues,
+    }
+    if index_path is not None:
+        create_dir(os.path.dirname(index_path) or ".")
+        with open(index_path, "w") as file:
+            json.dump(index, file, indent=2)
+
+    print(
+        f"Indexed {len(entries)} stems: {len(issues['orphans'])} orphans, "
+        f"{len(issues['empty_masks'])} empty masks, "
+        f"{len(issues['unreadable'])} unreadable files, "
+        f"{len(issues['duplicate_stems'])} repeated stems"
+    )
+    return index
+
+
+def get_pairs(index: dict, kinds: list[str]) -> list[dict]:
+    """
+    Return the entries of a dataset index that have a readable file of every kind, sorted by stem.
+
+    Args:
+        index (dict): Index returned by build_dataset_index.
+        kinds (list[str]): Kinds every entry must have, e.g. ["image", "mask"].
+
+    Returns:
+        list[dict]: Entries with the record of every kind.
+    """
+    return [
+        entry
+        for entry in index["entries"].values()
+        if all(kind in entry and entry[kind]["valid"] for kind in kinds)
+    ]
+
+
+def rename_indexed_files(
+    index: dict, prefix: str, index_path: str | None = None
+) -> dict:
+    """
+    Rename the files of a dataset index with a prefix and a number counter, like rename_files, giving the image, mask and label of a stem the same new name, and return the index with the new names. Files with a repeated stem are not in the entries and keep their name.
+
+    Args:
+        index (dict): Index returned by build_dataset_index.
+        prefix (str): Prefix to rename the files.
+        index_path (str | None, optional): JSON file to save the renamed index. Defaults to None.
+
+    Returns:
+        dict: Index with the new paths and stems.
+    """
+    stems = {}
+    paths = {}
+    entries = {}
+    for i, stem in enumerate(
+        sorted(index["entries"], key=detect_numbers_in_name), start=1
+    ):
+        new_stem = f"{prefix}_{i:05d}"
+        stems[stem] = new_stem
+        entries[new_stem] = {}
+        for kind, record in index["entries"][stem].items():
+            _, ext = os.path.splitext(record["path"])
+            new_path = os.path.join(os.path.dirname(record["path"]), new_stem + ext)
+            os.rename(record["path"], new_path)
+            paths[record["path"]] = new_path
+            entries[new_stem][kind] = {**record, "path": new_path, "name": new_stem}
+
+    issues = index["issues"]
+    renamed = {
+        "paths": index["paths"],
+        "entries": entries,
+        "issues": {
+            "orphans": [
+                {**orphan, "stem": stems[orphan["stem"]]}
+                for orphan in issues["orphans"]
+            ],
+            "empty_masks": [stems[stem] for stem in issues["empty_masks"]],
+            "unreadable": [paths[path] for path in issues["unreadable"]],
+            "duplicate_stems": issues["duplicate_stems"],
+        },
+    }
+    if index_path is not None:
+        with open(index_path, "w") as file:
+            json.dump(renamed, file, indent=2)
+    return renamed
+
+
 def split_data(
     image_path: str,
     label_path: str,
     train_ratio: float = 0.7,
     seed: int = 42,
+    duplicates: str | None = None,
+    max_distance: int = 4,
+    index: dict | None = None,
 ):
     """
     Split data into train, validation, and test sets and move them to their respective directories given a train ratio
@@ -181,16 +599,61 @@ def split_data(
         label_path (str): label path to split
         train_ratio (float, optional): Train ratio to split data. Defaults to 0.7.
         seed (int, optional): Random number seed. Defaults to 42.
+        duplicates (str | None, optional): "group" keeps every cluster of near-duplicate images in the same split, "thin" keeps one image per cluster and moves the rest to a duplicates folder. Defaults to None (ignore duplicates).
+        max_distance (int, optional): Maximum Hamming distance between two near duplicates. Defaults to 4.
+        index (dict | None, optional): Index of the images and labels from build_dataset_index. Defaults to None (build it).
+
+    Raises:
+        ValueError: If duplicates is not None, "group" or "thin".
     """
+    if duplicates not in (None, "group", "thin"):
+        raise ValueError(f"Unknown duplicates mode {duplicates}, use 'group' or 'thin'")
     random.seed(seed)
 
-    # Get sorted list of image and label files
-    image_files = sorted(os.listdir(image_path))
-    label_files = sorted(os.listdir(label_path))
+    # Join the image and label files by stem, orphans and unreadable files stay in place
+    if index is None:
+        index = build_dataset_index(image_path, labels_path=label_path)
+    data = [
+        (
+            os.path.basename(entry["image"]["path"]),
+            os.path.basename(entry["label"]["path"]),
+        )
+        for entry in get_pairs(index, ["image", "label"])
+    ]
 
-    # Combine image and label pairs and shuffle them
-    data = list(zip(image_files, label_files))
-    random.shuffle(data)
+    # Shuffle the image and label pairs
+    groups = []
+    if duplicates is None:
+        random.shuffle(data)
+    else:
+        # Shuffle the clusters of near duplicates instead of the single pairs
+        hashes = compute_hashes([os.path.join(image_path, img) for img, _ in data])
+        cluster_of = {}
+        for cluster in find_duplicate_clusters(hashes, max_distance):
+            for path in cluster:
+                cluster_of[os.path.basename(path)] = cluster[0]
+        groups = {}
+        for img, lbl in data:
+            groups.setdefault(cluster_of.get(img, img), []).append((img, lbl))
+        groups = list(groups.values())
+
+        if duplicates == "thin":
+            removed = [pair for group in groups for pair in group[1:]]
+            groups = [group[:1] for group in groups]
+            move_files(
+                image_path,
+                os.path.join(image_path, "duplicates"),
+                [img for img, _ in removed],
+            )
+            move_files(
+                label_path,
+                os.path.join(label_path, "duplicates"),
+                [lbl for _, lbl in removed],
+            )
+            print(f"Near duplicates removed: {len(removed)}")
+
+        random.shuffle(groups)
+        data = [pair for group in groups for pair in group]
 
     # Split the data into train, validation, and test sets
     train_end = int(train_ratio * len(data))  # End index for train subset
@@ -198,6 +661,14 @@ def split_data(
         (1 - train_ratio) / 2 * len(data)
     )  # End index for val subset
 
+    if duplicates == "group" and groups:
+        # Move the split indexes to the end of a cluster so it is never cut
+        group_ends = []
+        for group in groups:
+            group_ends.append((group_ends[-1] if group_ends else 0) + len(group))
+        train_end = next(end for end in group_ends if end >= train_end)
+        val_end = next(end for end in group_ends if end >= max(val_end, train_end))
+
     train_data = data[:train_end]
     val_data = data[train_end:val_end]
     test_data = data[val_end:]
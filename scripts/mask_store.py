@@ -0,0 +1,198 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from .archive_data import read_file_bytes, read_image
+from .manage_data import create_dir, detect_files
+
+
+def is_mask_store(path: str) -> bool:
+    """
+    Check if a path is a mask store instead of a directory of mask images.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a mask store.
+    """
+    return path.endswith(".mstore")
+
+
+def pack_mask(mask_path: str) -> tuple[np.ndarray, int, int, int]:
+    """
+    Decode a mask and pack it to one bit per pixel. Every non zero pixel is foreground, as for connectedComponentsWithStats.
+
+    Args:
+        mask_path (str): Path of the mask image, on disk or inside an archive.
+
+    Raises:
+        FileNotFoundError: If the mask can not be read.
+
+    Returns:
+        tuple[np.ndarray, int, int, int]: Packed bits, height and width of the mask and size of the encoded file.
+    """
+    data = read_file_bytes(mask_path)
+    mask = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise FileNotFoundError(f"Mask {mask_path} can not be read.")
+    return np.packbits(mask > 0), mask.shape[0], mask.shape[1], len(data)
+
+
+def build_mask_store(
+    masks_path: str, store_path: str | None = None, workers: int | None = None
+) -> str:
+    """
+    Convert a directory of binary masks into a single bit-packed file (store.mstore) that can be memory-mapped, with an index of the name, byte offset and shape of every mask (store.mstore.index). The masks keep the sorted order of detect_files.
+
+    Args:
+        masks_path (str): Path of the mask images, on disk or inside an archive.
+        store_path (str | None, optional): Path of the store, ending with .mstore. Defaults to masks_path + ".mstore".
+        workers (int | None, optional): Threads decoding masks. Defaults to the number of cores.
+
+    Returns:
+        str: Path of the store.
+    """
+    store_path = store_path or masks_path.rstrip("/") + ".mstore"
+    create_dir(os.path.dirname(store_path) or ".")
+    masks = detect_files(masks_path, [".png", ".jpg", ".tif"])
+
+    index = []
+    offset = 0
+    source_bytes = 0
+    with open(store_path, "wb") as file:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for mask_path, (bits, height, width, size) in zip(
+                masks, executor.map(pack_mask, masks)
+            ):
+                file.write(bits.tobytes())
+                index.append(
+                    {
+                        "name": os.path.splitext(os.path.basename(mask_path))[0],
+                        "offset": offset,
+                        "height": height,
+                        "width": width,
+                    }
+                )
+                offset += len(bits)
+                source_bytes += size
+
+    with open(store_path + ".index", "w") as file:
+        json.dump(index, file)
+
+    print(
+        f"Masks packed: {len(index)}, {source_bytes / 2**20:.2f} MiB -> "
+        f"{offset / 2**20:.2f} MiB ({source_bytes / max(offset, 1):.1f}x smaller)"
+    )
+    return store_path
+
+
+class MaskStore:
+    """
+    Read-only access to the masks of a mask store. The packed bits are memory-mapped, so a mask is read and unpacked only when it is requested. Iterating the store yields the masks in the order of the original directory.
+    """
+
+    def __init__(self, store_path: str):
+        """
+        Args:
+            store_path (str): Path of the store, ending with .mstore.
+
+        Raises:
+            FileNotFoundError: If the store or its index is not found.
+        """
+        if not os.path.exists(store_path + ".index"):
+            raise FileNotFoundError(f"Mask store {store_path} not found.")
+        with open(store_path + ".index", "r") as file:
+            self.index = json.load(file)
+        self.entries = {entry["name"]: entry for entry in self.index}
+        self.bits = (
+            np.memmap(store_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(store_path)
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __iter__(self):
+        for entry in self.index:
+            yield self.unpack(entry)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        Return a mask by its name without extension.
+
+        Args:
+            name (str): Name of the mask.
+
+        Returns:
+            np.ndarray: Mask with 1 in the foreground and 0 in the background.
+        """
+        return self.unpack(self.entries[name])
+
+    def names(self) -> list[str]:
+        """
+        Return the names of the masks in the order of the store.
+
+        Returns:
+            list[str]: Names of the masks.
+        """
+        return [entry["name"] for entry in self.index]
+
+    def unpack(self, entry: dict) -> np.ndarray:
+        """
+        Unpack the bits of a mask.
+
+        Args:
+            entry (dict): Entry of the mask in the index.
+
+        Returns:
+            np.ndarray: Mask of shape (height, width) and type uint8.
+        """
+        pixels = entry["height"] * entry["width"]
+        start = entry["offset"]
+        packed = self.bits[start : start + (pixels + 7) // 8]
+        return np.unpackbits(packed, count=pixels).reshape(
+            entry["height"], entry["width"]
+        )
+
+
+def open_masks(masks_path: str) -> MaskStore | dict:
+    """
+    Open the masks of a dataset by name, from a mask store or a directory of mask images.
+
+    Args:
+        masks_path (str): Path to the masks, a directory of mask images or a mask store.
+
+    Returns:
+        MaskStore | dict: The store or the path of every mask keyed by its name without extension.
+    """
+    if is_mask_store(masks_path):
+        return MaskStore(masks_path)
+    return {
+        os.path.splitext(os.path.basename(mask_path))[0]: mask_path
+        for mask_path in detect_files(masks_path, [".png", ".jpg", ".tif"])
+    }
+
+
+def read_mask(masks: MaskStore | dict, name: str) -> np.ndarray | None:
+    """
+    Return a mask opened with open_masks by its name.
+
+    Args:
+        masks (MaskStore | dict): Masks returned by open_masks.
+        name (str): Name of the mask without extension.
+
+    Returns:
+        np.ndarray | None: Mask with non zero values in the foreground, None if it is not found.
+    """
+    if name not in masks:
+        return None
+    mask = masks[name]
+    if isinstance(mask, str):
+        mask = read_image(mask, cv2.IMREAD_GRAYSCALE)
+    return mask
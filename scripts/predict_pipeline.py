@@ -0,0 +1,343 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import cv2
+import numpy as np
+from .manage_data import create_dir, detect_files
+from ultralytics import YOLO
+from .inference_cache import InferenceCache, get_cache_key, get_model_hash
+from .prediction_store import PredictionStoreWriter
+from .process_images import draw_boxes
+from .yolo_utils import get_best_model, get_device
+
+
+def format_labels(
+    classes: np.ndarray, boxes: np.ndarray, confs: np.ndarray | None
+) -> str:
+    """
+    Format the detections of an image as a YOLO label file, the same way ultralytics save_txt does.
+
+    Args:
+        classes (np.ndarray): Class of every box.
+        boxes (np.ndarray): Normalized boxes (x_center, y_center, width, height).
+        confs (np.ndarray | None): Confidence of every box, None to leave it out.
+
+    Returns:
+        str: Content of the label file.
+    """
+    lines = []
+    for i in range(len(classes)):
+        line = (int(classes[i]), *boxes[i].tolist())
+        if confs is not None:
+            line += (float(confs[i]),)
+        lines.append(("%g " * len(line)).rstrip() % line)
+    return "".join(f"{line}\n" for line in lines)
+
+
+class StageTimer:
+    """
+    Accumulate the busy time of the workers of a pipeline stage.
+    """
+
+    def __init__(self, workers: int):
+        """
+        Args:
+            workers (int): Number of workers of the stage.
+        """
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float, items: int = 1) -> None:
+        """
+        Add the time a worker spent processing items.
+
+        Args:
+            seconds (float): Busy time.
+            items (int, optional): Items processed. Defaults to 1.
+        """
+        with self.lock:
+            self.busy += seconds
+            self.items += items
+
+    def utilization(self, wall: float) -> float:
+        """
+        Return the fraction of the wall time the workers of the stage were busy.
+
+        Args:
+            wall (float): Wall time of the pipeline.
+
+        Returns:
+            float: Utilization between 0 and 1.
+        """
+        return self.busy / (wall * self.workers) if wall > 0 else 0.0
+
+
+def get_rows(result) -> np.ndarray:
+    """
+    Return the detections of an ultralytics result as rows (class, x_center, y_center, width, height, conf) with normalized coordinates.
+
+    Args:
+        result (Results): Result of a prediction.
+
+    Returns:
+        np.ndarray: Rows of the detections.
+    """
+    boxes = result.boxes
+    return np.concatenate(
+        [
+            boxes.cls.cpu().numpy().reshape(-1, 1),
+            boxes.xywhn.cpu().numpy().reshape(-1, 4),
+            boxes.conf.cpu().numpy().reshape(-1, 1),
+        ],
+        axis=1,
+    ).astype(np.float32)
+
+
+def predict_pipelined(
+    model_path: str,
+    test_images_path: str,
+    name: str,
+    project: str,
+    image_size: int = 640,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    batch_size: int = 8,
+    decode_workers: int = 4,
+    write_workers: int = 2,
+    queue_size: int = 32,
+    save_labels: bool = True,
+    save_images: bool = False,
+    save_conf: bool = False,
+    label_format: str = "txt",
+    cache_path: str | None = None,
+    cache_max_size_mb: float = 256,
+    device: str | None = None,
+) -> dict:
+    """
+    Predict a folder of images overlapping the decoding, the batched inference and the writing of the outputs. Every stage runs in its own threads connected by bounded queues, and the utilization of each one is reported to show whether the run is bound by decoding, compute or disk. Outputs use the same layout as make_predicts (project/name/labels).
+
+    With a cache, the decoders hash every image file and the detections found in the cache for the same image, weights and parameters skip the decoding and the model.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+        test_images_path (str): Path to the images to predict.
+        name (str): Name of the prediction run.
+        project (str): Project to save the predictions.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        conf (float, optional): Confidence threshold. Defaults to 0.25.
+        iou (float, optional): IoU threshold of the NMS. Defaults to 0.7.
+        batch_size (int, optional): Images per inference call. Defaults to 8.
+        decode_workers (int, optional): Threads decoding images. Defaults to 4.
+        write_workers (int, optional): Threads writing labels and images. Defaults to 2.
+        queue_size (int, optional): Maximum items waiting between two stages. Defaults to 32.
+        save_labels (bool, optional): Write the YOLO label files. Defaults to True.
+        save_images (bool, optional): Write the images with the boxes drawn. Defaults to False.
+        save_conf (bool, optional): Add the confidence to the label files. Defaults to False.
+        label_format (str, optional): "txt" writes one label file per image, "store" writes every prediction to project/name/predictions.pstore. Defaults to "txt".
+        cache_path (str | None, optional): Path of the inference cache. Defaults to None (no cache).
+        cache_max_size_mb (float, optional): Size budget of the cache in MiB. Defaults to 256.
+        device (str | None, optional): Device to run on. Defaults to the one returned by get_device.
+
+    Returns:
+        dict: Number of images, wall time, throughput, utilization of every stage and cache hits.
+
+    Raises:
+        ValueError: If label_format is not "txt" or "store".
+    """
+    if label_format not in ("txt", "store"):
+        raise ValueError(f"Unknown label format {label_format}, use 'txt' or 'store'")
+    device = device or get_device()
+    output_path = os.path.join(project, name)
+    labels_path = os.path.join(output_path, "labels")
+    create_dir(output_path)
+    store = None
+    if save_labels and label_format == "store":
+        store_path = os.path.join(output_path, "predictions.pstore")
+        for path in [store_path, store_path + ".index"]:
+            if os.path.exists(path):
+                os.remove(path)
+        store = PredictionStoreWriter(store_path)
+    elif save_labels:
+        # Remove labels of a previous run, images without detections do not overwrite them
+        if os.path.isdir(labels_path):
+            shutil.rmtree(labels_path)
+        create_dir(labels_path)
+
+    cache = None
+    if cache_path is not None:
+        cache = InferenceCache(cache_path, cache_max_size_mb)
+        model_hash = get_model_hash(model_path)
+
+    # The model is only loaded when an image is not in the cache
+    model_lock = threading.Lock()
+    models = []
+
+    def get_model() -> YOLO:
+        with model_lock:
+            if not models:
+                models.append(get_best_model(model_path))
+            return models[0]
+
+    image_paths = queue.Queue()
+    for image_path in detect_files(test_images_path, [".png", ".jpg", ".tif"]):
+        image_paths.put(image_path)
+    total_images = image_paths.qsize()
+
+    decoded = queue.Queue(maxsize=queue_size)
+    predicted = queue.Queue(maxsize=queue_size)
+    timers = {
+        "decode": StageTimer(decode_workers),
+        "inference": StageTimer(1),
+        "write": StageTimer(write_workers),
+    }
+
+    # First error of a stage, the other stages stop and drain their queues
+    errors = []
+
+    def decode() -> None:
+        try:
+            while not errors:
+                try:
+                    image_path = image_paths.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.perf_counter()
+                with open(image_path, "rb") as file:
+                    data = file.read()
+                key = None
+                rows = None
+                if cache is not None:
+                    key = get_cache_key(data, model_hash, image_size, conf, iou)
+                    rows = cache.get(key)
+                image = None
+                if rows is None or save_images:
+                    image = cv2.imdecode(
+                        np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR
+                    )
+                timers["decode"].add(time.perf_counter() - start)
+                if rows is not None:
+                    predicted.put((image_path, rows, image))
+                elif image is None:
+                    print(f"Error to read {image_path}")
+                else:
+                    decoded.put((image_path, image, key))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            decoded.put(None)
+
+    def infer() -> None:
+        finished_decoders = 0
+        batch = []
+        try:
+            while finished_decoders < decode_workers:
+                item = decoded.get()
+                if item is None:
+                    finished_decoders += 1
+                else:
+                    batch.append(item)
+                if not batch or (
+                    len(batch) < batch_size and finished_decoders < decode_workers
+                ):
+                    continue
+                start = time.perf_counter()
+                results = get_model().predict(
+                    [image for _, image, _ in batch],
+                    imgsz=image_size,
+                    conf=conf,
+                    iou=iou,
+                    device=device,
+                    verbose=False,
+                )
+                timers["inference"].add(time.perf_counter() - start, len(batch))
+                for (image_path, image, key), result in zip(batch, results):
+                    rows = get_rows(result)
+                    if cache is not None:
+                        cache.put(key, rows)
+                    predicted.put((image_path, rows, image if save_images else None))
+                batch = []
+        except Exception as e:
+            errors.append(e)
+            # No decoder may stay blocked on a full queue
+            while finished_decoders < decode_workers:
+                if decoded.get() is None:
+                    finished_decoders += 1
+        finally:
+            for _ in range(write_workers):
+                predicted.put(None)
+
+    def write() -> None:
+        while True:
+            item = predicted.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            image_path, rows, image = item
+            start = time.perf_counter()
+            base_name = os.path.basename(image_path)
+            label_file = os.path.splitext(base_name)[0] + ".txt"
+            try:
+                if store is not None:
+                    store.append(
+                        os.path.splitext(base_name)[0],
+                        rows[:, 0],
+                        rows[:, 5],
+                        rows[:, 1:5],
+                    )
+                elif save_labels and len(rows):
+                    with open(os.path.join(labels_path, label_file), "w") as file:
+                        file.write(
+                            format_labels(
+                                rows[:, 0],
+                                rows[:, 1:5],
+                                rows[:, 5] if save_conf else None,
+                            )
+                        )
+                if save_images:
+                    cv2.imwrite(
+                        os.path.join(output_path, base_name), draw_boxes(image, rows)
+                    )
+            except Exception as e:
+                errors.append(e)
+            timers["write"].add(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = (
+        [threading.Thread(target=decode) for _ in range(decode_workers)]
+        + [threading.Thread(target=infer)]
+        + [threading.Thread(target=write) for _ in range(write_workers)]
+    )
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if store is not None:
+        store.close()
+    if errors:
+        if cache is not None:
+            cache.close()
+        raise errors[0]
+    wall = time.perf_counter() - start
+
+    report = {
+        "images": total_images,
+        "wall_s": wall,
+        "throughput": total_images / wall if wall > 0 else 0.0,
+        "utilization": {
+            stage: timer.utilization(wall) for stage, timer in timers.items()
+        },
+    }
+    print(f"Images: {total_images} in {wall:.2f} s")
+    print(f"Throughput: {report['throughput']:.2f} img/s")
+    for stage, utilization in report["utilization"].items():
+        print(f"Utilization {stage}: {utilization * 100:.1f} %")
+    if cache is not None:
+        report["cache"] = cache.report()
+        cache.close()
+        print(f"Cache hit rate: {report['cache']['hit_rate'] * 100:.1f} %")
+    return report
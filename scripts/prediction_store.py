@@ -0,0 +1,232 @@
+import json
+import os
+import struct
+import threading
+import numpy as np
+from .manage_data import create_dir, detect_files
+
+# Every chunk starts with the magic bytes and the number of rows, followed by the columns
+CHUNK_MAGIC = b"PST1"
+CHUNK_HEADER = struct.Struct("<4sI")
+COLUMNS = [
+    ("image_id", np.int32),
+    ("class", np.int32),
+    ("conf", np.float32),
+    ("x_center", np.float32),
+    ("y_center", np.float32),
+    ("width", np.float32),
+    ("height", np.float32),
+]
+
+
+def is_prediction_store(path: str) -> bool:
+    """
+    Check if a path is a prediction store instead of a directory of label files.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a prediction store.
+    """
+    return path.endswith(".pstore")
+
+
+class PredictionStoreWriter:
+    """
+    Append the predictions of a run to a single columnar file. Rows are buffered and written as chunks of columns, and an index with the image id, name and rows of every image is appended next to it (store.index).
+    """
+
+    def __init__(self, store_path: str, chunk_rows: int = 4096):
+        """
+        Args:
+            store_path (str): Path of the store, ending with .pstore.
+            chunk_rows (int, optional): Rows buffered before writing a chunk. Defaults to 4096.
+        """
+        create_dir(os.path.dirname(store_path) or ".")
+        self.store_path = store_path
+        self.chunk_rows = chunk_rows
+        self.lock = threading.Lock()
+        self.rows = {name: [] for name, _ in COLUMNS}
+        self.index = []
+        self.next_id = 0
+        self.next_row = 0
+
+        # Continue the ids of a store that already has predictions
+        if os.path.exists(store_path + ".index"):
+            with open(store_path + ".index", "r") as file:
+                for line in file:
+                    entry = json.loads(line)
+                    self.next_id = max(self.next_id, entry["id"] + 1)
+                    self.next_row = max(self.next_row, entry["row"] + entry["count"])
+
+    def append(
+        self,
+        image_name: str,
+        classes: np.ndarray,
+        confs: np.ndarray,
+        boxes: np.ndarray,
+    ) -> None:
+        """
+        Add the predictions of an image, an image without predictions is also recorded.
+
+        Args:
+            image_name (str): Name of the image without extension.
+            classes (np.ndarray): Class of every box.
+            confs (np.ndarray): Confidence of every box.
+            boxes (np.ndarray): Normalized boxes (x_center, y_center, width, height).
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        with self.lock:
+            image_id = self.next_id
+            self.next_id += 1
+            self.index.append(
+                {
+                    "id": image_id,
+                    "name": image_name,
+                    "row": self.next_row,
+                    "count": len(boxes),
+                }
+            )
+            self.next_row += len(boxes)
+            self.rows["image_id"] += [image_id] * len(boxes)
+            self.rows["class"] += np.asarray(classes).astype(int).tolist()
+            self.rows["conf"] += np.asarray(confs, dtype=np.float32).tolist()
+            for i, column in enumerate(["x_center", "y_center", "width", "height"]):
+                self.rows[column] += boxes[:, i].tolist()
+            if len(self.rows["image_id"]) >= self.chunk_rows:
+                self._write_chunk()
+
+    def _write_chunk(self) -> None:
+        """
+        Write the buffered rows as a chunk and the buffered index entries.
+        """
+        rows = len(self.rows["image_id"])
+        if rows:
+            with open(self.store_path, "ab") as file:
+                file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, rows))
+                for name, dtype in COLUMNS:
+                    file.write(np.asarray(self.rows[name], dtype=dtype).tobytes())
+            self.rows = {name: [] for name, _ in COLUMNS}
+        # The index is written after the rows so it never points to missing data
+        with open(self.store_path + ".index", "a") as file:
+            for entry in self.index:
+                file.write(json.dumps(entry) + "\n")
+        self.index = []
+
+    def close(self) -> None:
+        """
+        Write the remaining buffered rows.
+        """
+        with self.lock:
+            self._write_chunk()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_prediction_store(store_path: str) -> dict:
+    """
+    Read all the predictions of a store.
+
+    Args:
+        store_path (str): Path of the store.
+
+    Returns:
+        dict: Array of rows (class, x_center, y_center, width, height, conf) keyed by image name.
+    """
+    index = []
+    with open(store_path + ".index", "r") as file:
+        for line in file:
+            index.append(json.loads(line))
+
+    columns = {name: [] for name, _ in COLUMNS}
+    if os.path.exists(store_path):
+        with open(store_path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset < len(data):
+            magic, rows = CHUNK_HEADER.unpack_from(data, offset)
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"Corrupted prediction store {store_path}")
+            offset += CHUNK_HEADER.size
+            for name, dtype in COLUMNS:
+                columns[name].append(np.frombuffer(data, dtype, rows, offset))
+                offset += rows * np.dtype(dtype).itemsize
+    columns = {
+        name: np.concatenate(columns[name]) if columns[name] else np.zeros(0, dtype)
+        for name, dtype in COLUMNS
+    }
+
+    table = np.stack(
+        [
+            columns[name]
+            for name in ["class", "x_center", "y_center", "width", "height", "conf"]
+        ],
+        axis=1,
+    ).astype(np.float32)
+    return {
+        entry["name"]: table[entry["row"] : entry["row"] + entry["count"]]
+        for entry in index
+    }
+
+
+def read_label_file(label_file: str) -> np.ndarray:
+    """
+    Read the rows of a YOLO label file.
+
+    Args:
+        label_file (str): Path of the label file.
+
+    Returns:
+        np.ndarray: Rows (class, x_center, y_center, width, height[, conf]), empty if the file has no boxes.
+    """
+    with open(label_file, "r") as file:
+        rows = [list(map(float, line.split())) for line in file if line.strip()]
+    return np.array(rows, dtype=np.float32) if rows else np.zeros((0, 5), np.float32)
+
+
+def load_labels(labels_path: str) -> dict:
+    """
+    Load YOLO labels from a directory of label files or from a prediction store.
+
+    Args:
+        labels_path (str): Directory of label files or path of a store.
+
+    Returns:
+        dict: Array of rows (class, x_center, y_center, width, height[, conf]) keyed by file name without extension.
+    """
+    if is_prediction_store(labels_path):
+        return read_prediction_store(labels_path)
+
+    labels = {}
+    for label_file in detect_files(labels_path, [".txt"]):
+        name = os.path.splitext(os.path.basename(label_file))[0]
+        labels[name] = read_label_file(label_file)
+    return labels
+
+
+def export_prediction_store(
+    store_path: str, output_labels_path: str, save_conf: bool = False
+) -> None:
+    """
+    Export a prediction store to one YOLO label file per image, as written by make_predicts.
+
+    Args:
+        store_path (str): Path of the store.
+        output_labels_path (str): Path to save the label files.
+        save_conf (bool, optional): Add the confidence to the label files. Defaults to False.
+    """
+    create_dir(output_labels_path)
+    for name, rows in read_prediction_store(store_path).items():
+        if not len(rows):
+            continue
+        with open(os.path.join(output_labels_path, name + ".txt"), "w") as file:
+            for row in rows:
+                line = (int(row[0]), *row[1:5].tolist())
+                if save_conf:
+                    line += (float(row[5]),)
+                file.write(("%g " * len(line)).rstrip() % line + "\n")
@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from .dataset_stats import sum_stats, summarize_labels
+from .manage_data import (
+    compute_hashes,
+    copy_images,
+    create_dir,
+    find_duplicate_clusters,
+)
+from .prediction_store import read_label_file
+from .process_images import annotate_images
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parse a shard given as "i/N", with i from 0 to N - 1.
+
+    Args:
+        shard (str): Shard to parse.
+
+    Raises:
+        ValueError: If the shard is not valid.
+
+    Returns:
+        tuple[int, int]: Shard index and number of shards.
+    """
+    index, shards = (int(value) for value in shard.split("/"))
+    if not 0 <= index < shards:
+        raise ValueError(f"Shard {shard} is not valid, expected i/N with 0 <= i < N.")
+    return index, shards
+
+
+def get_manifest_path(output_path: str, shard: tuple[int, int]) -> str:
+    """
+    Return the path of the manifest of a shard.
+
+    Args:
+        output_path (str): Path of the prepared dataset.
+        shard (tuple[int, int]): Shard index and number of shards.
+
+    Returns:
+        str: Path of the manifest.
+    """
+    return os.path.join(output_path, "shards", f"shard_{shard[0]}_of_{shard[1]}.json")
+
+
+def prepare_shard(
+    images_path: str,
+    masks_path: str,
+    output_path: str,
+    shard: tuple[int, int],
+    blob_store: str | None = None,
+    class_index: int = 0,
+    workers: int | None = None,
+) -> str:
+    """
+    Prepare the files of a shard of a dataset: copy its images and masks, annotate its images from the masks, hash its images for the duplicate search and compute the statistics of its labels. Every shard writes disjoint files in the output folders and a manifest with its files, hashes and statistics.
+
+    Args:
+        images_path (str): Path of the raw images, on disk or inside a zip archive.
+        masks_path (str): Path of the raw masks, on disk or inside a zip archive.
+        output_path (str): Path of the prepared dataset (images, masks and labels folders).
+        shard (tuple[int, int]): Shard index and number of shards.
+        blob_store (str | None, optional): Path of the blob store to deduplicate the copies. Defaults to None.
+        class_index (int, optional): Index of the class. Defaults to 0.
+        workers (int | None, optional): Threads hashing images. Defaults to the number of cores.
+
+    Returns:
+        str: Path of the manifest of the shard.
+    """
+    images = copy_images(images_path, f"{output_path}/images", blob_store, shard)
+    masks = copy_images(masks_path, f"{output_path}/masks", blob_store, shard)
+    labels = annotate_images(
+        images_path, masks_path, f"{output_path}/labels", class_index, shard
+    )
+    hashes = compute_hashes(images, workers)
+    stats = summarize_labels(len(images), [read_label_file(label) for label in labels])
+
+    manifest_path = get_manifest_path(output_path, shard)
+    create_dir(os.path.dirname(manifest_path))
+    with open(manifest_path, "w") as file:
+        json.dump(
+            {
+                "shard": list(shard),
+                "images": [os.path.basename(path) for path in images],
+                "masks": [os.path.basename(path) for path in masks],
+                "labels": [os.path.basename(path) for path in labels],
+                "hashes": {
+                    os.path.basename(path): image_hash
+                    for path, image_hash in hashes.items()
+                },
+                "stats": stats,
+            },
+            file,
+        )
+    print(
+        f"Shard {shard[0]}/{shard[1]}: {len(images)} images, {len(masks)} masks, "
+        f"{len(labels)} labels"
+    )
+    return manifest_path
+
+
+def merge_shards(output_path: str, shards: int, max_distance: int = 4) -> dict:
+    """
+    Combine the manifests of all the shards of a dataset in manifest.json, search the near-duplicate images across all of them from their hashes (duplicates.json) and add up their statistics.
+
+    Args:
+        output_path (str): Path of the prepared dataset.
+        shards (int): Number of shards.
+        max_distance (int, optional): Maximum Hamming distance between two near duplicates. Defaults to 4.
+
+    Raises:
+        FileNotFoundError: If the manifest of a shard is missing.
+        ValueError: If a file was prepared by more than one shard.
+
+    Returns:
+        dict: Merged manifest.
+    """
+    manifests = []
+    for index in range(shards):
+        manifest_path = get_manifest_path(output_path, (index, shards))
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Manifest of shard {index}/{shards} not found.")
+        with open(manifest_path, "r") as file:
+            manifests.append(json.load(file))
+
+    merged = {"shards": shards}
+    for field in ["images", "masks", "labels"]:
+        files = [name for manifest in manifests for name in manifest[field]]
+        if len(set(files)) != len(files):
+            raise ValueError(f"Some {field} were prepared by more than one shard.")
+        merged[field] = sorted(files)
+
+    hashes = {
+        os.path.join(output_path, "images", name): image_hash
+        for manifest in manifests
+        for name, image_hash in manifest["hashes"].items()
+    }
+    clusters = find_duplicate_clusters(hashes, max_distance)
+    merged["stats"] = sum_stats([manifest["stats"] for manifest in manifests])
+
+    with open(os.path.join(output_path, "manifest.json"), "w") as file:
+        json.dump(merged, file, indent=2)
+    with open(os.path.join(output_path, "duplicates.json"), "w") as file:
+        json.dump(clusters, file, indent=2)
+
+    print(
+        f"Merged {shards} shards: {len(merged['images'])} images, "
+        f"{merged['stats']['polyps']} polyps, {len(clusters)} duplicate clusters"
+    )
+    return merged
+
+
+def run_local(
+    images_path: str,
+    masks_path: str,
+    output_path: str,
+    shards: int,
+    blob_store: str | None = None,
+    class_index: int = 0,
+) -> dict:
+    """
+    Prepare a dataset on one host running every shard as a separate process, like N machines would, and merge them.
+
+    Args:
+        images_path (str): Path of the raw images, on disk or inside a zip archive.
+        masks_path (str): Path of the raw masks, on disk or inside a zip archive.
+        output_path (str): Path of the prepared dataset.
+        shards (int): Number of shards.
+        blob_store (str | None, optional): Path of the blob store to deduplicate the copies. Defaults to None.
+        class_index (int, optional): Index of the class. Defaults to 0.
+
+    Raises:
+        RuntimeError: If a shard fails.
+
+    Returns:
+        dict: Merged manifest.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "scripts.prepare_data",
+        "shard",
+        images_path,
+        masks_path,
+        output_path,
+        "--class-index",
+        str(class_index),
+    ]
+    if blob_store is not None:
+        command += ["--blob-store", blob_store]
+
+    processes = [
+        subprocess.Popen(command + ["--shard", f"{index}/{shards}"])
+        for index in range(shards)
+    ]
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards {failed} of {shards} failed.")
+    return merge_shards(output_path, shards)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry of the sharded data preparation.
+
+    python -m scripts.prepare_data shard IMAGES MASKS OUTPUT --shard i/N [--blob-store PATH]
+    python -m scripts.prepare_data merge OUTPUT --shards N
+    python -m scripts.prepare_data local IMAGES MASKS OUTPUT --shards N [--blob-store PATH]
+
+    Args:
+        argv (list[str] | None, optional): Arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Sharded data preparation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shard_parser = commands.add_parser("shard", help="Prepare one shard")
+    local_parser = commands.add_parser("local", help="Run every shard on this host")
+    for command_parser in [shard_parser, local_parser]:
+        command_parser.add_argument("images_path")
+        command_parser.add_argument("masks_path")
+        command_parser.add_argument("output_path")
+        command_parser.add_argument("--blob-store", default=None)
+        command_parser.add_argument("--class-index", type=int, default=0)
+    shard_parser.add_argument("--shard", type=parse_shard, required=True)
+    local_parser.add_argument("--shards", type=int, required=True)
+
+    merge_parser = commands.add_parser("merge", help="Merge the shards")
+    merge_parser.add_argument("output_path")
+    merge_parser.add_argument("--shards", type=int, required=True)
+    merge_parser.add_argument("--max-distance", type=int, default=4)
+
+    args = parser.parse_args(argv)
+    if args.command == "shard":
+        prepare_shard(
+            args.images_path,
+            args.masks_path,
+            args.output_path,
+            args.shard,
+            args.blob_store,
+            args.class_index,
+        )
+    elif args.command == "merge":
+        merge_shards(args.output_path, args.shards, args.max_distance)
+    else:
+        run_local(
+            args.images_path,
+            args.masks_path,
+            args.output_path,
+            args.shards,
+            args.blob_store,
+            args.class_index,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import os
+from typing import Iterable
 import cv2
-from .manage_data import detect_files, create_dir
+import numpy as np
+from .manage_data import (
+    MASK_SUFFIX,
+    build_dataset_index,
+    create_dir,
+    detect_files,
+    get_pairs,
+    get_stem,
+    inspect_file,
+)
+from .prediction_store import load_labels
+from .mask_store import MaskStore, is_mask_store
+from .archive_data import read_image
 
 
 def save_bbox(txt_path: str, line_to_write: str) -> None:
@@ -16,17 +29,20 @@ def save_bbox(txt_path: str, line_to_write: str) -> None:
         my_file.write(line_to_write + "\n")
 
 
-def detect_object(mask: str, min_area: int = 35) -> list | None:
+def detect_object(mask: str | np.ndarray, min_area: int = 35) -> list | None:
     """
     Detect objects in a binary mask and return the coordinates for every object detected in a list of tuples.
 
     Args:
-        mask (str): Path to the binary mask image.
+        mask (str | np.ndarray): Path to the binary mask image (on disk or inside an archive) or the mask already decoded (e.g. from a mask store), every non zero pixel is foreground.
 
     Returns:
         list | None: List of tuples with the coordinates of the objects detected in the mask.
     """
-    mask_image = cv2.imread(mask, cv2.IMREAD_GRAYSCALE)
+    if isinstance(mask, np.ndarray):
+        mask_image = (mask > 0).astype(np.uint8)
+    else:
+        mask_image = read_image(mask, cv2.IMREAD_GRAYSCALE)
     num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask_image)
     objects_coordiantes = []
     for i in range(1, num_labels):
@@ -90,60 +106,171 @@ def yolo_format(
     return yolo_format
 
 
+def get_mask_pairs(
+    images_path: str,
+    masks_path: str,
+    index: dict | None = None,
+    shard: tuple[int, int] | None = None,
+) -> Iterable[tuple[dict, str | np.ndarray]]:
+    """
+    Join every readable image with its mask by stem using a dataset index, the mask is the path of its file or its array unpacked from a mask store. Images without a readable mask are skipped.
+
+    Args:
+        images_path (str): Path to the images.
+        masks_path (str): Path to the masks, a directory of mask images or a mask store.
+        index (dict | None, optional): Index from build_dataset_index. Defaults to None (build it).
+        shard (tuple[int, int] | None, optional): Join only the stems of a shard. Defaults to None (all).
+
+    Returns:
+        Iterable[tuple[dict, str | np.ndarray]]: Record of the image and its mask, sorted by stem.
+    """
+    if not is_mask_store(masks_path):
+        if index is None:
+            index = build_dataset_index(images_path, masks_path, shard=shard)
+        return [
+            (entry["image"], entry["mask"]["path"])
+            for entry in get_pairs(index, ["image", "mask"])
+        ]
+
+    if index is None:
+        index = build_dataset_index(images_path, shard=shard)
+    store = MaskStore(masks_path)
+    names = {get_stem(name, MASK_SUFFIX): name for name in store.names()}
+    pairs = [
+        (entry["image"], names[stem])
+        for stem, entry in index["entries"].items()
+        if "image" in entry and entry["image"]["valid"] and stem in names
+    ]
+    skipped = len(index["entries"]) - len(pairs)
+    if skipped:
+        print(f"{skipped} stems without a readable image and mask in {masks_path}")
+    # The masks are unpacked one by one while the pairs are consumed
+    return ((image, store[name]) for image, name in pairs)
+
+
 def annotate_images(
-    images_path: str, masks_path: str, output_labels_path: str, class_index: int = 0
-) -> None:
+    images_path: str,
+    masks_path: str,
+    output_labels_path: str,
+    class_index: int = 0,
+    shard: tuple[int, int] | None = None,
+    index: dict | None = None,
+) -> list[str]:
     """
     Annotate images with the bounding boxes of the objects detected in the masks and save the labels in a txt file.
 
     Args:
         images_path (str): Path to the images.
-        masks_path (str): Path to the masks.
+        masks_path (str): Path to the masks, a directory of mask images or a mask store.
         output_labels_path (str): Path to save the labels.
         class_index (int, optional): Index of the class. Defaults to 0.
+        shard (tuple[int, int] | None, optional): Annotate only the images of a shard (index, number of shards). Defaults to None (all).
+        index (dict | None, optional): Index of the images and masks from build_dataset_index, the records of the new labels are added to it. Defaults to None (build it).
+
+    Returns:
+        list[str]: Paths of the label files.
     """
     create_dir(output_labels_path)
-    images = detect_files(images_path, [".png", ".jpg", ".tif"])
-    masks = detect_files(masks_path, [".png", ".jpg", ".tif"])
-    for image, mask in zip(images, masks):
-        image_read = cv2.imread(image)
+    label_files = []
+    for image, mask in get_mask_pairs(images_path, masks_path, index, shard):
+        # The image size comes from the index, the image is not decoded again
         objects_coordinates = detect_object(mask)
         objects_coordinates = normalize_coordiantes(objects_coordinates)
         yolo_labels = yolo_format(
             class_index,
             objects_coordinates,
-            image_read.shape[1],
-            image_read.shape[0],
+            image["width"],
+            image["height"],
         )
-        base_name = os.path.splitext(os.path.basename(image))[0]
-        output_txt_path = os.path.join(output_labels_path, base_name)
+        output_txt_path = os.path.join(output_labels_path, image["name"])
         save_bbox(output_txt_path, "\n".join(yolo_labels))
+        label_files.append(output_txt_path + ".txt")
+
+    # Later stages (renaming, splitting) find the labels in the same index
+    if index is not None:
+        index["paths"]["label"] = output_labels_path
+        for label_file in label_files:
+            index["entries"][get_stem(label_file)]["label"] = inspect_file(
+                label_file, "label"
+            )
+    return label_files
 
 
 def draw_bounding_boxes_on_images(
     images_path: str,
     masks_path: str,
     output_bbox_images: str,
+    index: dict | None = None,
 ) -> None:
     """
     Draw bounding boxes on images using the coordinates obtained from the mask object
 
     Args:
         images_path (str): Path of images
-        masks_path (str): Path of masks
+        masks_path (str): Path of masks, a directory of mask images or a mask store
         output_bbox_images (str): Path to save the images with bounding boxes
+        index (dict | None, optional): Index of the images and masks from build_dataset_index. Defaults to None (build it).
     """
     create_dir(output_bbox_images)
 
-    images = detect_files(images_path, [".png", ".jpg", ".tif"])
-    masks = detect_files(masks_path, [".png", ".jpg", ".tif"])
-    for image_path, mask_path in zip(images, masks):
-        image = cv2.imread(image_path)
-        object_coordinates = detect_object(mask_path)
+    for record, mask in get_mask_pairs(images_path, masks_path, index):
+        image_path = record["path"]
+        image = read_image(image_path)
+        object_coordinates = detect_object(mask)
         for coord in object_coordinates:
             x1, y1, x2, y2 = coord
             cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 0), 3)
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
-            ext_type = os.path.splitext(os.path.basename(image_path))[1]
-            output_image_path = os.path.join(output_bbox_images, base_name)
-            cv2.imwrite(output_image_path + ext_type, image)
+        cv2.imwrite(
+            os.path.join(output_bbox_images, os.path.basename(image_path)), image
+        )
+
+
+def draw_boxes(
+    image: np.ndarray, rows: np.ndarray, color: tuple = (0, 0, 255), thickness: int = 3
+) -> np.ndarray:
+    """
+    Draw YOLO boxes on an image.
+
+    Args:
+        image (np.ndarray): Image to draw on, modified in place.
+        rows (np.ndarray): Rows (class, x_center, y_center, width, height[, conf]) with normalized coordinates.
+        color (tuple, optional): BGR color of the boxes. Defaults to (0, 0, 255).
+        thickness (int, optional): Thickness of the boxes. Defaults to 3.
+
+    Returns:
+        np.ndarray: Image with the boxes.
+    """
+    height, width = image.shape[:2]
+    for row in rows:
+        x_center, y_center, box_width, box_height = row[1:5]
+        x1 = int((x_center - box_width / 2) * width)
+        y1 = int((y_center - box_height / 2) * height)
+        x2 = int((x_center + box_width / 2) * width)
+        y2 = int((y_center + box_height / 2) * height)
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+    return image
+
+
+def draw_predictions_on_images(
+    images_path: str,
+    predictions_path: str,
+    output_bbox_images: str,
+) -> None:
+    """
+    Draw the predicted bounding boxes on images, writing every image once
+
+    Args:
+        images_path (str): Path of images
+        predictions_path (str): Path of the predicted labels, a directory of label files or a prediction store
+        output_bbox_images (str): Path to save the images with bounding boxes
+    """
+    create_dir(output_bbox_images)
+
+    predictions = load_labels(predictions_path)
+    images = detect_files(images_path, [".png", ".jpg", ".tif"])
+    for image_path in images:
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        image = draw_boxes(cv2.imread(image_path), predictions.get(base_name, []))
+        cv2.imwrite(
+            os.path.join(output_bbox_images, os.path.basename(image_path)), image
+        )
@@ -0,0 +1,259 @@
+import copy
+import json
+import math
+import os
+import time
+import torch
+from torch import nn
+from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.nn.modules import Bottleneck, Conv, Detect
+from ultralytics.utils.torch_utils import get_flops
+from .manage_data import create_dir
+from .yolo_utils import export_model, get_best_model
+
+
+def get_prune_groups(model: nn.Module) -> list[tuple[Conv, nn.Conv2d]]:
+    """
+    Return the convolutions whose output channels can be removed without changing the shape of any other tensor of the model, each with the convolution that consumes them: the first convolution of every bottleneck (its output only feeds the second one, the residual is added after) and the hidden convolutions of the box branch of the detection head.
+
+    Args:
+        model (nn.Module): Detection model.
+
+    Returns:
+        list[tuple[Conv, nn.Conv2d]]: Pruned convolution (with batch normalization) and next convolution.
+    """
+    groups = []
+    for module in model.modules():
+        if isinstance(module, Bottleneck) and module.cv2.conv.groups == 1:
+            groups.append((module.cv1, module.cv2.conv))
+        elif isinstance(module, Detect):
+            for branch in module.cv2:
+                groups.append((branch[0], branch[1].conv))
+                groups.append((branch[1], branch[2]))
+    return groups
+
+
+def prune_channels(conv: Conv, next_conv: nn.Conv2d, keep: torch.Tensor) -> None:
+    """
+    Keep only some output channels of a convolution, its batch normalization and the matching input channels of the next convolution.
+
+    Args:
+        conv (Conv): Convolution with batch normalization to prune.
+        next_conv (nn.Conv2d): Convolution that consumes the output of conv.
+        keep (torch.Tensor): Indices of the channels to keep.
+    """
+    conv.conv.weight = nn.Parameter(conv.conv.weight.data[keep].clone())
+    conv.conv.out_channels = len(keep)
+    bn = conv.bn
+    bn.weight = nn.Parameter(bn.weight.data[keep].clone())
+    bn.bias = nn.Parameter(bn.bias.data[keep].clone())
+    bn.running_mean = bn.running_mean[keep].clone()
+    bn.running_var = bn.running_var[keep].clone()
+    bn.num_features = len(keep)
+    next_conv.weight = nn.Parameter(next_conv.weight.data[:, keep].clone())
+    next_conv.in_channels = len(keep)
+
+
+def prune_model(model: nn.Module, ratio: float, min_channels: int = 8) -> nn.Module:
+    """
+    Return a copy of a model without the share ratio of prunable channels with the smallest batch normalization scale (|gamma|), using one global threshold so the least important layers lose more channels. Every layer keeps at least min_channels and a multiple of 8 channels.
+
+    Args:
+        model (nn.Module): Detection model.
+        ratio (float): Share of the prunable channels to remove.
+        min_channels (int, optional): Minimum channels kept per layer. Defaults to 8.
+
+    Returns:
+        nn.Module: Pruned model.
+    """
+    model = copy.deepcopy(model)
+    groups = get_prune_groups(model)
+    if any(not hasattr(conv, "bn") for conv, _ in groups):
+        raise ValueError(
+            "The model is fused (validation fuses it in place), prune a copy taken before."
+        )
+    if not groups or ratio <= 0:
+        return model
+
+    gammas = torch.cat([conv.bn.weight.detach().abs() for conv, _ in groups])
+    threshold = torch.quantile(gammas, ratio)
+    for conv, next_conv in groups:
+        importance = conv.bn.weight.detach().abs()
+        channels = len(importance)
+        kept = int((importance > threshold).sum())
+        kept = min(channels, max(min_channels, math.ceil(kept / 8) * 8))
+        if kept < channels:
+            keep = torch.sort(torch.argsort(importance, descending=True)[:kept]).values
+            prune_channels(conv, next_conv, keep)
+    return model
+
+
+def measure_model(model: nn.Module, image_size: int = 640, repeats: int = 10) -> dict:
+    """
+    Measure the GFLOPs, parameters and CPU latency of a model at batch size 1.
+
+    Args:
+        model (nn.Module): Detection model.
+        image_size (int, optional): Input image size. Defaults to 640.
+        repeats (int, optional): Timed forward passes. Defaults to 10.
+
+    Returns:
+        dict: GFLOPs, parameters and latency in ms.
+    """
+    model = copy.deepcopy(model).float().cpu().eval()
+    image = torch.zeros(1, 3, image_size, image_size)
+    with torch.inference_mode():
+        for _ in range(2):
+            model(image)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(image)
+        latency = (time.perf_counter() - start) / repeats * 1000
+    return {
+        "gflops": get_flops(model, image_size),
+        "parameters": sum(parameter.numel() for parameter in model.parameters()),
+        "latency_ms": latency,
+    }
+
+
+def select_pruning_ratio(
+    model: nn.Module,
+    image_size: int = 640,
+    target_latency_ms: float | None = None,
+    target_gflops: float | None = None,
+    ratios: list[float] | None = None,
+) -> tuple[float, nn.Module, dict]:
+    """
+    Prune a model at increasing ratios and return the smallest one that meets the latency and FLOPs targets, or the largest ratio with a warning if none does. Only the bottlenecks and the box branch of the head are pruned, so the largest ratio may be far from a tight target; the measures tell whether it was met (target_met).
+
+    Args:
+        model (nn.Module): Detection model.
+        image_size (int, optional): Input image size. Defaults to 640.
+        target_latency_ms (float | None, optional): Maximum CPU latency. Defaults to None.
+        target_gflops (float | None, optional): Maximum GFLOPs. Defaults to None.
+        ratios (list[float] | None, optional): Ratios to try. Defaults to 0.1 to 0.8.
+
+    Returns:
+        tuple[float, nn.Module, dict]: Ratio, pruned model and its measures, with target_met.
+    """
+    ratios = sorted(ratios or [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+    for ratio in ratios:
+        pruned = prune_model(model, ratio)
+        measures = measure_model(pruned, image_size)
+        print(
+            f"Ratio {ratio:.2f}: {measures['gflops']:.2f} GFLOPs, "
+            f"{measures['latency_ms']:.1f} ms"
+        )
+        target_met = (
+            target_latency_ms is None or measures["latency_ms"] <= target_latency_ms
+        ) and (target_gflops is None or measures["gflops"] <= target_gflops)
+        if target_met:
+            break
+
+    measures["target_met"] = target_met
+    if not target_met:
+        print(
+            f"Warning: no pruning ratio meets the target, using {ratio:.2f} "
+            f"({measures['latency_ms']:.1f} ms, {measures['gflops']:.2f} GFLOPs)"
+        )
+    return ratio, pruned, measures
+
+
+def validate_metrics(model: YOLO, yaml_path: str, image_size: int, device: str) -> dict:
+    """
+    Return the box metrics of a model on the validation split.
+
+    Args:
+        model (YOLO): Model to validate.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        image_size (int): Image size.
+        device (str): Device to run on.
+
+    Returns:
+        dict: mAP50 and mAP50-95.
+    """
+    metrics = model.val(data=yaml_path, imgsz=image_size, device=device, plots=False)
+    return {"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map)}
+
+
+def prune_and_finetune(
+    model_path: str,
+    yaml_path: str,
+    name: str,
+    project: str,
+    target_latency_ms: float | None = None,
+    target_gflops: float | None = None,
+    image_size: int = 640,
+    epoches: int = 20,
+    batch_size: int = 8,
+    export_format: str = "onnx",
+    device: str = "cpu",
+) -> dict:
+    """
+    Remove the least important channels of a trained model until it meets a CPU latency or FLOPs target, fine-tune it briefly on the dataset, export it with export_model and save a report (pruning_report.json in the pruned model path) with the FLOPs, parameters, latency and validation metrics before and after.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        name (str): Name of the pruned model.
+        project (str): Project to save the pruned model.
+        target_latency_ms (float | None, optional): Maximum CPU latency at batch size 1. Defaults to None.
+        target_gflops (float | None, optional): Maximum GFLOPs. Defaults to None.
+        image_size (int, optional): Image size. Defaults to 640.
+        epoches (int, optional): Epoches of the fine-tuning. Defaults to 20.
+        batch_size (int, optional): Size of the batch. Defaults to 8.
+        export_format (str, optional): Format to export the pruned model. Defaults to "onnx".
+        device (str, optional): Device to train on. Defaults to "cpu".
+
+    Returns:
+        dict: Report of the pruning.
+    """
+    original = get_best_model(model_path)
+    # Validation fuses the convolutions with their batch normalization in place
+    unfused = copy.deepcopy(original.model)
+    before = measure_model(unfused, image_size)
+    before.update(validate_metrics(original, yaml_path, image_size, device))
+
+    ratio, pruned, selected = select_pruning_ratio(
+        unfused, image_size, target_latency_ms, target_gflops
+    )
+
+    class PrunedTrainer(DetectionTrainer):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            return pruned
+
+    original.train(
+        data=yaml_path,
+        trainer=PrunedTrainer,
+        epochs=epoches,
+        imgsz=image_size,
+        batch=batch_size,
+        device=device,
+        name=name,
+        project=project,
+        exist_ok=True,
+    )
+
+    pruned_path = os.path.join(project, name)
+    finetuned = get_best_model(pruned_path)
+    after = measure_model(finetuned.model, image_size)
+    after.update(validate_metrics(finetuned, yaml_path, image_size, device))
+    export_model(pruned_path, export_format)
+
+    report = {
+        "ratio": ratio,
+        "target_latency_ms": target_latency_ms,
+        "target_gflops": target_gflops,
+        "target_met": selected["target_met"],
+        "before": before,
+        "after": after,
+        "delta": {key: after[key] - before[key] for key in before},
+    }
+    create_dir(pruned_path)
+    with open(os.path.join(pruned_path, "pruning_report.json"), "w") as file:
+        json.dump(report, file, indent=2)
+
+    for key in before:
+        print(f"{key:<12} {before[key]:>14.4f} -> {after[key]:>14.4f}")
+    return report
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+from ultralytics import YOLO
+from .benchmark_utils import (
+    load_images,
+    measure_latency,
+    predict_and_evaluate,
+    sample_images,
+)
+from .manage_data import create_dir
+from .yolo_utils import get_best_model
+
+
+def quantize_model(
+    model_path: str,
+    yaml_path: str,
+    dataset_path: str,
+    image_size: int = 640,
+    calibration_fraction: float = 0.25,
+    max_accuracy_drop: float = 0.02,
+    sample_size: int = 32,
+    iou_threshold: float = 0.75,
+) -> dict:
+    """
+    Quantize the best model of a training to INT8 for CPU inference, calibrating it on a fraction of images/val. Both models are scored on images/test and the quantized model is only published when its sensibility drops less than max_accuracy_drop, otherwise it is moved to the quantization folder as rejected.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        dataset_path (str): Path of the dataset with the images and labels folders.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        calibration_fraction (float, optional): Fraction of images/val used for the calibration. Defaults to 0.25.
+        max_accuracy_drop (float, optional): Maximum sensibility drop allowed (0.02 = 2 points). Defaults to 0.02.
+        sample_size (int, optional): Number of test images used to measure the latency. Defaults to 32.
+        iou_threshold (float, optional): IoU threshold of the evaluation. Defaults to 0.75.
+
+    Returns:
+        dict: Report with the latency and metrics of both models and if the quantized model was published.
+    """
+    quantization_path = os.path.join(model_path, "quantization")
+    create_dir(quantization_path)
+
+    fp32_model = get_best_model(model_path)
+    # OpenVINO is the INT8 CPU runtime supported by the ultralytics exporter
+    artifact = fp32_model.export(
+        format="openvino",
+        int8=True,
+        data=yaml_path,
+        fraction=calibration_fraction,
+        imgsz=image_size,
+        device="cpu",
+    )
+    int8_model = YOLO(str(artifact), task="detect")
+
+    images_test = f"{dataset_path}/images/test"
+    labels_test = f"{dataset_path}/labels/test"
+    images = load_images(sample_images(images_test, sample_size))
+
+    report = {
+        "model": f"{model_path}/weights/best.pt",
+        "max_accuracy_drop": max_accuracy_drop,
+    }
+    for precision, model in [("fp32", fp32_model), ("int8", int8_model)]:
+        report[precision] = {
+            "latency": measure_latency(model, images, 1, image_size),
+            "metrics": predict_and_evaluate(
+                model,
+                images_test,
+                labels_test,
+                name=precision,
+                project=quantization_path,
+                image_size=image_size,
+                iou_threshold=iou_threshold,
+            ),
+        }
+
+    fp32_latency = report["fp32"]["latency"]["latency_per_image_ms"]
+    int8_latency = report["int8"]["latency"]["latency_per_image_ms"]
+    report["speedup"] = fp32_latency / int8_latency
+    report["accuracy_drop"] = (
+        report["fp32"]["metrics"]["sensibility"]
+        - report["int8"]["metrics"]["sensibility"]
+    )
+    report["published"] = report["accuracy_drop"] <= max_accuracy_drop
+
+    if report["published"]:
+        report["path"] = str(artifact)
+    else:
+        rejected_path = os.path.join(quantization_path, "rejected_int8_openvino_model")
+        if os.path.exists(rejected_path):
+            shutil.rmtree(rejected_path)
+        shutil.move(str(artifact), rejected_path)
+        report["path"] = rejected_path
+
+    with open(os.path.join(quantization_path, "report.json"), "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(f"Latency FP32: {fp32_latency:.2f} ms, INT8: {int8_latency:.2f} ms")
+    print(f"Speedup: {report['speedup']:.2f}x")
+    print(f"Sensibility drop: {report['accuracy_drop'] * 100:.2f} %")
+    print(
+        f"INT8 model published at {report['path']}"
+        if report["published"]
+        else f"INT8 model rejected, drop above {max_accuracy_drop * 100:.2f} %"
+    )
+
+    return report
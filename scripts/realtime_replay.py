@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from ultralytics import YOLO
+from .benchmark_utils import load_images
+from .manage_data import create_dir, detect_files
+from .yolo_utils import get_best_model
+
+
+def replay_frames(
+    model: YOLO,
+    frames: list[np.ndarray],
+    fps: float = 25,
+    deadline_ms: float | None = None,
+    image_size: int = 640,
+    device: str = "cpu",
+    warmup: int = 5,
+) -> dict:
+    """
+    Feed decoded frames to a model at a fixed frame rate, like a video capture would. A frame that arrives while the model is busy replaces the waiting one, which is counted as dropped, and a processed frame is late when its end-to-end latency (from its arrival to the end of its inference) is over the deadline.
+
+    Args:
+        model (YOLO): Model to run.
+        frames (list[np.ndarray]): Decoded frames of the sequence.
+        fps (float, optional): Frame rate of the replay. Defaults to 25.
+        deadline_ms (float | None, optional): Maximum latency of a frame. Defaults to the frame period.
+        image_size (int, optional): Inference image size. Defaults to 640.
+        device (str, optional): Device to run on. Defaults to "cpu".
+        warmup (int, optional): Untimed inferences before the replay. Defaults to 5.
+
+    Raises:
+        ValueError: If there are no frames.
+
+    Returns:
+        dict: Latency percentiles, jitter and share of dropped and late frames, NaN latencies if no frame was processed.
+    """
+    if not frames:
+        raise ValueError("No frames to replay.")
+    period = 1 / fps
+    deadline = deadline_ms / 1000 if deadline_ms is not None else period
+    for i in range(warmup):
+        model.predict(
+            frames[i % len(frames)], imgsz=image_size, device=device, verbose=False
+        )
+
+    condition = threading.Condition()
+    waiting = []  # Frame waiting for the model, at most one
+    finished = []
+    dropped = 0
+    latencies = []
+    completions = []
+
+    def capture() -> None:
+        nonlocal dropped
+        start = time.perf_counter()
+        for i in range(len(frames)):
+            arrival = start + i * period
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with condition:
+                if waiting:
+                    waiting.pop()
+                    dropped += 1
+                waiting.append((i, arrival))
+                condition.notify()
+        with condition:
+            finished.append(True)
+            condition.notify()
+
+    def infer() -> None:
+        while True:
+            with condition:
+                while not waiting and not finished:
+                    condition.wait()
+                if not waiting:
+                    break
+                i, arrival = waiting.pop()
+            model.predict(frames[i], imgsz=image_size, device=device, verbose=False)
+            done = time.perf_counter()
+            latencies.append(done - arrival)
+            completions.append(done)
+
+    threads = [threading.Thread(target=capture), threading.Thread(target=infer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = np.array(latencies) * 1000
+    intervals = np.diff(completions) * 1000
+    late = int(np.sum(latencies > deadline * 1000))
+    if not len(latencies):
+        latencies = np.array([np.nan])
+    return {
+        "frames": len(frames),
+        "fps": fps,
+        "deadline_ms": deadline * 1000,
+        "processed": len(latencies),
+        "dropped": dropped,
+        "late": late,
+        "dropped_rate": dropped / len(frames),
+        "late_rate": late / len(frames),
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+        "latency_max_ms": float(latencies.max()),
+        "jitter_ms": float(latencies.std()),
+        "output_interval_jitter_ms": (
+            float(intervals.std()) if len(intervals) else 0.0
+        ),
+    }
+
+
+def replay_report(
+    models: dict,
+    frames_path: str,
+    output_path: str,
+    fps: float = 25,
+    deadline_ms: float | None = None,
+    max_miss_rate: float = 0.05,
+    image_size: int = 640,
+) -> dict:
+    """
+    Replay a folder of frames (for example a PolypGen sequenceData sequence) to every model at a fixed frame rate on the CPU and report whether each one meets the real-time budget, that is, whether the share of dropped plus late frames is at most max_miss_rate.
+
+    Args:
+        models (dict): Path to the model output of every model, keyed by its name.
+        frames_path (str): Folder with the frames of the sequence.
+        output_path (str): Path to save realtime_replay.json.
+        fps (float, optional): Frame rate of the replay. Defaults to 25.
+        deadline_ms (float | None, optional): Maximum latency of a frame. Defaults to the frame period.
+        max_miss_rate (float, optional): Maximum share of dropped and late frames. Defaults to 0.05.
+        image_size (int, optional): Inference image size. Defaults to 640.
+
+    Raises:
+        FileNotFoundError: If there are no frames in frames_path.
+
+    Returns:
+        dict: Replay results of every model.
+    """
+    frame_paths = detect_files(frames_path, [".png", ".jpg", ".tif"])
+    if not frame_paths:
+        raise FileNotFoundError(f"No frames found in {frames_path}.")
+    create_dir(output_path)
+    # Frames are decoded before the replay, as a capture device delivers them
+    frames = load_images(frame_paths)
+
+    report = {}
+    for name, model_path in models.items():
+        result = replay_frames(
+            get_best_model(model_path),
+            frames,
+            fps=fps,
+            deadline_ms=deadline_ms,
+            image_size=image_size,
+        )
+        miss_rate = result["dropped_rate"] + result["late_rate"]
+        result["realtime"] = miss_rate <= max_miss_rate
+        report[name] = result
+        print(
+            f"{name}: p95 {result['latency_p95_ms']:.1f} ms, "
+            f"dropped {result['dropped_rate'] * 100:.1f} %, "
+            f"late {result['late_rate'] * 100:.1f} %, "
+            f"jitter {result['jitter_ms']:.1f} ms, "
+            f"{'meets' if result['realtime'] else 'misses'} {fps} FPS"
+        )
+
+    with open(os.path.join(output_path, "realtime_replay.json"), "w") as file:
+        json.dump({"frames_path": frames_path, "models": report}, file, indent=2)
+    return report
@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from .archive_data import read_image
+from .manage_data import create_dir, detect_files
+from .prediction_store import load_labels
+from .process_images import draw_boxes
+
+# BGR colors of the ground truth and predicted boxes
+GT_COLOR = (0, 255, 0)
+PRED_COLOR = (0, 0, 255)
+
+
+def render_image(
+    image_path: str,
+    gt_rows: np.ndarray,
+    pred_rows: np.ndarray,
+    output_path: str,
+    thumbnail_size: int | None = None,
+    save_thumbnail: bool = False,
+) -> np.ndarray | None:
+    """
+    Draw the ground truth and predicted boxes of an image and write it once.
+
+    Args:
+        image_path (str): Path of the image, on disk or inside an archive.
+        gt_rows (np.ndarray): Ground truth rows (class, x_center, y_center, width, height).
+        pred_rows (np.ndarray): Predicted rows (class, x_center, y_center, width, height[, conf]).
+        output_path (str): Path to save the rendered image.
+        thumbnail_size (int | None, optional): Longest side of the thumbnail. Defaults to None (no thumbnail).
+        save_thumbnail (bool, optional): Also write the thumbnail to output_path/thumbnails. Defaults to False.
+
+    Returns:
+        np.ndarray | None: Thumbnail of the rendered image if thumbnail_size is given.
+    """
+    image = read_image(image_path)
+    if image is None:
+        print(f"Error to read {image_path}")
+        return None
+
+    thickness = max(1, round(max(image.shape[:2]) / 200))
+    draw_boxes(image, gt_rows, GT_COLOR, thickness)
+    draw_boxes(image, pred_rows, PRED_COLOR, thickness)
+    base_name = os.path.basename(image_path)
+    cv2.imwrite(os.path.join(output_path, base_name), image)
+
+    if thumbnail_size is None:
+        return None
+    scale = thumbnail_size / max(image.shape[:2])
+    thumbnail = cv2.resize(
+        image,
+        (round(image.shape[1] * scale), round(image.shape[0] * scale)),
+        interpolation=cv2.INTER_AREA,
+    )
+    if save_thumbnail:
+        cv2.imwrite(os.path.join(output_path, "thumbnails", base_name), thumbnail)
+    return thumbnail
+
+
+def make_mosaic(
+    thumbnails: list[np.ndarray], columns: int, cell_size: int
+) -> np.ndarray:
+    """
+    Tile thumbnails in a contact sheet, centering each one in a square cell.
+
+    Args:
+        thumbnails (list[np.ndarray]): Thumbnails with a longest side of at most cell_size.
+        columns (int): Number of columns of the sheet.
+        cell_size (int): Side of every cell.
+
+    Returns:
+        np.ndarray: Contact sheet.
+    """
+    rows = (len(thumbnails) + columns - 1) // columns
+    mosaic = np.zeros((rows * cell_size, columns * cell_size, 3), dtype=np.uint8)
+    for i, thumbnail in enumerate(thumbnails):
+        height, width = thumbnail.shape[:2]
+        y = (i // columns) * cell_size + (cell_size - height) // 2
+        x = (i % columns) * cell_size + (cell_size - width) // 2
+        mosaic[y : y + height, x : x + width] = thumbnail
+    return mosaic
+
+
+def render_dataset(
+    images_path: str,
+    output_path: str,
+    gt_labels_path: str | None = None,
+    predictions_path: str | None = None,
+    workers: int | None = None,
+    thumbnail_size: int | None = None,
+    save_thumbnails: bool = False,
+    mosaic_columns: int = 8,
+    mosaic_rows: int = 6,
+) -> None:
+    """
+    Render the ground truth (green) and predicted (red) boxes of a folder of images with a pool of workers. The labels are loaded once and every image is decoded, drawn and written once. Optionally the rendered images are downscaled to thumbnails and tiled in contact sheets (output_path/mosaics) for review.
+
+    Args:
+        images_path (str): Path of the images.
+        output_path (str): Path to save the rendered images.
+        gt_labels_path (str | None, optional): Ground truth labels, a directory of label files or a prediction store. Defaults to None.
+        predictions_path (str | None, optional): Predicted labels, a directory of label files or a prediction store. Defaults to None.
+        workers (int | None, optional): Number of workers. Defaults to the number of cores.
+        thumbnail_size (int | None, optional): Longest side of the thumbnails, enables the contact sheets. Defaults to None.
+        save_thumbnails (bool, optional): Also write every thumbnail. Defaults to False.
+        mosaic_columns (int, optional): Columns of every contact sheet. Defaults to 8.
+        mosaic_rows (int, optional): Rows of every contact sheet. Defaults to 6.
+    """
+    create_dir(output_path)
+    if save_thumbnails:
+        create_dir(os.path.join(output_path, "thumbnails"))
+
+    gt_labels = load_labels(gt_labels_path) if gt_labels_path else {}
+    predictions = load_labels(predictions_path) if predictions_path else {}
+    images = detect_files(images_path, [".png", ".jpg", ".tif"])
+
+    def render(image_path: str) -> np.ndarray | None:
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        return render_image(
+            image_path,
+            gt_labels.get(base_name, []),
+            predictions.get(base_name, []),
+            output_path,
+            thumbnail_size,
+            save_thumbnails,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        thumbnails = [
+            thumbnail
+            for thumbnail in executor.map(render, images)
+            if thumbnail is not None
+        ]
+
+    if thumbnails:
+        mosaics_path = os.path.join(output_path, "mosaics")
+        create_dir(mosaics_path)
+        per_sheet = mosaic_columns * mosaic_rows
+        for i in range(0, len(thumbnails), per_sheet):
+            cv2.imwrite(
+                os.path.join(mosaics_path, f"mosaic_{i // per_sheet:03d}.jpg"),
+                make_mosaic(
+                    thumbnails[i : i + per_sheet], mosaic_columns, thumbnail_size
+                ),
+            )
+
+    print(f"Images rendered: {len(images)}")
@@ -0,0 +1,348 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+import psutil
+import torch
+from .autotune import autotune_loader
+from .manage_data import create_dir
+from .yolo_utils import find_last_checkpoint, resume_training, train_model
+
+# Status of a job in the state file
+PENDING = "pending"
+RUNNING = "running"
+INTERRUPTED = "interrupted"
+DONE = "done"
+FAILED = "failed"
+
+
+def create_training_job(
+    model_path: str,
+    yaml_path: str,
+    name: str,
+    project: str,
+    epoches: int = 1000,
+    image_size: int = 640,
+    batch_size: int = 4,
+    save_period: int = 100,
+    threads: int = 1,
+    device: str = "cpu",
+    workers: int = 8,
+    cache: bool | str = False,
+    autotune: bool = False,
+) -> dict:
+    """
+    Create a training job with the same parameters used by train_model and the number of cores to reserve for it.
+
+    Args:
+        model_path (str): Path of the model to train.
+        yaml_path (str): Path from the yaml file with the dataset information.
+        name (str): Name of the model.
+        project (str): Project to save the model.
+        epoches (int, optional): Number of epoches to train the model. Defaults to 1000.
+        image_size (int, optional): Resize the images to this size. Defaults to 640.
+        batch_size (int, optional): Size of the batch to use for training. Defaults to 4.
+        save_period (int, optional): Period to save the model. Defaults to 100.
+        threads (int, optional): Number of cores and torch threads reserved for the job. Defaults to 1.
+        device (str, optional): Device to train on. Defaults to "cpu".
+        workers (int, optional): Number of dataloader workers. Defaults to 8.
+        cache (bool | str, optional): Cache the images in "ram" or "disk". Defaults to False.
+        autotune (bool, optional): Choose batch size, workers and cache with autotune_loader before training. Defaults to False.
+
+    Returns:
+        dict: Job ready to be added to a queue.
+    """
+    return {
+        "id": f"{project}/{name}",
+        "status": PENDING,
+        "attempts": 0,
+        "model_path": model_path,
+        "yaml_path": yaml_path,
+        "name": name,
+        "project": project,
+        "epoches": epoches,
+        "image_size": image_size,
+        "batch_size": batch_size,
+        "save_period": save_period,
+        "threads": threads,
+        "device": device,
+        "workers": workers,
+        "cache": cache,
+        "autotune": autotune,
+        "cores": [],
+        "pid": None,
+        "started": None,
+        "finished": None,
+        "returncode": None,
+    }
+
+
+def load_queue_state(state_path: str) -> dict:
+    """
+    Load the state file of a training queue, returning an empty queue if it does not exist.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+
+    Returns:
+        dict: State of the queue with the list of jobs.
+    """
+    if not os.path.exists(state_path):
+        return {"jobs": []}
+    with open(state_path, "r") as file:
+        return json.load(file)
+
+
+def save_queue_state(state_path: str, state: dict) -> None:
+    """
+    Save the state of a training queue, replacing the file atomically so an interruption never leaves it half written.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+        state (dict): State of the queue.
+    """
+    create_dir(os.path.dirname(state_path) or ".")
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def add_training_jobs(state_path: str, jobs: list[dict]) -> None:
+    """
+    Add jobs to a training queue, ignoring the ones already registered so the same queue can be declared several times.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+        jobs (list[dict]): Jobs created with create_training_job.
+    """
+    state = load_queue_state(state_path)
+    registered = {job["id"] for job in state["jobs"]}
+    for job in jobs:
+        if job["id"] not in registered:
+            state["jobs"].append(job)
+            registered.add(job["id"])
+    save_queue_state(state_path, state)
+
+
+def get_available_cores(max_cores: int | None = None) -> list[int]:
+    """
+    Return the cores this process is allowed to run on.
+
+    Args:
+        max_cores (int | None, optional): Maximum number of cores to use. Defaults to all of them.
+
+    Returns:
+        list[int]: Sorted list of core ids.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    return cores[:max_cores] if max_cores else cores
+
+
+def is_job_alive(job: dict) -> bool:
+    """
+    Check if the process that ran a job is still alive, comparing its command line with the job id so a reused pid is not taken for it.
+
+    Args:
+        job (dict): Job with the pid of its process.
+
+    Returns:
+        bool: True if the process of the job is running.
+    """
+    pid = job.get("pid")
+    if not pid:
+        return False
+    try:
+        process = psutil.Process(pid)
+        alive = process.status() != psutil.STATUS_ZOMBIE
+        return alive and job["id"] in process.cmdline()
+    except psutil.Error:
+        return False
+
+
+def start_job(state_path: str, job: dict, cores: list[int]) -> subprocess.Popen:
+    """
+    Start a job in a new process limited to the given cores.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+        job (dict): Job to run.
+        cores (list[int]): Cores reserved for the job.
+
+    Returns:
+        subprocess.Popen: Process running the job.
+    """
+    env = os.environ.copy()
+    threads = str(len(cores))
+    for variable in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+        env[variable] = threads
+
+    run_path = os.path.join(job["project"], job["name"])
+    create_dir(run_path)
+    log_file = open(os.path.join(run_path, "train_queue.log"), "a")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "scripts.train_queue",
+            state_path,
+            job["id"],
+        ],
+        env=env,
+        preexec_fn=(
+            (lambda: os.sched_setaffinity(0, cores))
+            if hasattr(os, "sched_setaffinity")
+            else None
+        ),
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    log_file.close()
+    return process
+
+
+def run_training_queue(
+    state_path: str,
+    max_cores: int | None = None,
+    poll_interval: float = 5.0,
+    max_retries: int = 2,
+) -> dict:
+    """
+    Run the pending jobs of a training queue, executing several of them at the same time while there are free cores. Jobs that were running when the queue died or that failed are resumed from their last checkpoint, up to max_retries times. A job whose process from a previous queue is still alive is waited for instead of being launched again.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+        max_cores (int | None, optional): Maximum number of cores to use. Defaults to all of them.
+        poll_interval (float, optional): Seconds between checks of the running jobs. Defaults to 5.0.
+        max_retries (int, optional): Launches of a job after its first one. Defaults to 2.
+
+    Returns:
+        dict: Final state of the queue.
+    """
+    state = load_queue_state(state_path)
+    free_cores = get_available_cores(max_cores)
+
+    # Processes of a previous queue still running, waited for by pid
+    adopted = set()
+    for job in state["jobs"]:
+        if job["status"] == RUNNING and is_job_alive(job):
+            adopted.add(job["id"])
+            free_cores = [core for core in free_cores if core not in job["cores"]]
+            print(f"Waiting for {job['id']} still running with pid {job['pid']}")
+        elif job["status"] == RUNNING or (
+            job["status"] == FAILED and job["attempts"] <= max_retries
+        ):
+            # A job marked as running without a process or failed is resumed
+            job["status"] = INTERRUPTED
+    save_queue_state(state_path, state)
+
+    running = {}
+    while True:
+        waiting = [
+            job for job in state["jobs"] if job["status"] in (PENDING, INTERRUPTED)
+        ]
+
+        # Launch every waiting job that fits in the free cores
+        for job in waiting:
+            threads = min(job["threads"], len(get_available_cores(max_cores)))
+            if threads > len(free_cores):
+                continue
+            cores, free_cores = free_cores[:threads], free_cores[threads:]
+            job["status"] = RUNNING
+            job["attempts"] += 1
+            job["cores"] = cores
+            job["started"] = datetime.now().isoformat(timespec="seconds")
+            running[job["id"]] = start_job(state_path, job, cores)
+            job["pid"] = running[job["id"]].pid
+            save_queue_state(state_path, state)
+            print(f"Started {job['id']} on cores {cores}")
+
+        if not running and not adopted:
+            break
+
+        time.sleep(poll_interval)
+
+        # Release the cores of finished jobs
+        for job in state["jobs"]:
+            process = running.get(job["id"])
+            if job["id"] in adopted and not is_job_alive(job):
+                # The result of a process of a previous queue is unknown, it is resumed
+                adopted.remove(job["id"])
+                returncode = None
+            elif process is not None and process.poll() is not None:
+                del running[job["id"]]
+                returncode = process.returncode
+            else:
+                continue
+            free_cores = sorted(free_cores + job["cores"])
+            job["returncode"] = returncode
+            job["finished"] = datetime.now().isoformat(timespec="seconds")
+            if returncode == 0:
+                job["status"] = DONE
+            elif job["attempts"] <= max_retries:
+                job["status"] = INTERRUPTED
+            else:
+                job["status"] = FAILED
+            save_queue_state(state_path, state)
+            print(f"Job {job['id']} {job['status']} after {job['attempts']} attempts")
+
+    return state
+
+
+def run_job(state_path: str, job_id: str) -> None:
+    """
+    Train the model of a job, resuming it from its last checkpoint when it was interrupted before.
+
+    Args:
+        state_path (str): Path of the JSON state file.
+        job_id (str): Id of the job to run.
+    """
+    torch.set_num_threads(len(get_available_cores()))
+
+    job = next(
+        job for job in load_queue_state(state_path)["jobs"] if job["id"] == job_id
+    )
+    checkpoint = find_last_checkpoint(os.path.join(job["project"], job["name"]))
+    if job["attempts"] > 1 and checkpoint is not None:
+        print(f"Resuming {job_id} from {checkpoint}")
+        resume_training(checkpoint, device=job["device"])
+        return
+
+    # Jobs saved before the loader options were added use the defaults
+    loader = {
+        "batch_size": job["batch_size"],
+        "workers": job.get("workers", 8),
+        "cache": job.get("cache", False),
+    }
+    if job.get("autotune", False):
+        loader = autotune_loader(
+            job["model_path"],
+            job["yaml_path"],
+            name=job["name"],
+            project=job["project"],
+            image_size=job["image_size"],
+            device=job["device"],
+        )
+
+    train_model(
+        job["model_path"],
+        job["yaml_path"],
+        epoches=job["epoches"],
+        image_size=job["image_size"],
+        batch_size=loader["batch_size"],
+        save_period=job["save_period"],
+        name=job["name"],
+        project=job["project"],
+        device=job["device"],
+        workers=loader["workers"],
+        cache=loader["cache"],
+    )
+
+
+if __name__ == "__main__":
+    run_job(sys.argv[1], sys.argv[2])
@@ -1,3 +1,4 @@
+import os
 import torch
 from ultralytics import YOLO
 
@@ -27,6 +28,9 @@ def train_model(
     save_period: int,
     name: str,
     project: str,
+    device: str | None = None,
+    workers: int = 8,
+    cache: bool | str = False,
 ) -> None:
     """
     Method to train a YOLO model.
@@ -40,6 +44,9 @@ def train_model(
         save_period (int): Period to save the model.
         name (str): Name of the model.
         project (str): Project to save the model.
+        device (str | None, optional): Device to train on. Defaults to the one returned by get_device.
+        workers (int, optional): Number of dataloader workers. Defaults to 8.
+        cache (bool | str, optional): Cache the images in "ram" or "disk". Defaults to False.
     """
     model = YOLO(model_path)
     model.train(
@@ -48,13 +55,50 @@ def train_model(
         imgsz=image_size,
         batch=batch_size,
         save_period=save_period,
-        device=get_device(),
+        device=device or get_device(),
+        workers=workers,
+        cache=cache,
         name=name,
         project=project,
         exist_ok=True,
     )
 
 
+def find_last_checkpoint(model_path: str) -> str | None:
+    """
+    Return the most recent checkpoint saved during a training, either the last.pt or one of the epochN.pt saved every save_period.
+
+    Args:
+        model_path (str): Path to the model output in the trainin model method.
+
+    Returns:
+        str | None: Path of the newest checkpoint or None if the training has not saved any.
+    """
+    weights_path = os.path.join(model_path, "weights")
+    if not os.path.isdir(weights_path):
+        return None
+    checkpoints = [
+        os.path.join(weights_path, file)
+        for file in os.listdir(weights_path)
+        if file == "last.pt" or (file.startswith("epoch") and file.endswith(".pt"))
+    ]
+    if not checkpoints:
+        return None
+    return max(checkpoints, key=os.path.getmtime)
+
+
+def resume_training(checkpoint_path: str, device: str | None = None) -> None:
+    """
+    Resume an interrupted training from a checkpoint, keeping the arguments saved in it.
+
+    Args:
+        checkpoint_path (str): Path to the checkpoint (last.pt or epochN.pt).
+        device (str | None, optional): Device to train on. Defaults to the one returned by get_device.
+    """
+    model = YOLO(checkpoint_path)
+    model.train(resume=True, device=device or get_device())
+
+
 def get_best_model(
     model_path: str,
 ) -> YOLO:
@@ -0,0 +1,31 @@
+import os
+from scripts.blob_store import collect_garbage, list_blobs, store_file
+
+
+def test_identical_files_share_one_blob(tmp_path):
+    store = tmp_path / "blobs"
+    view = tmp_path / "view"
+    view.mkdir()
+    for name in ["a.png", "b.png"]:
+        (tmp_path / name).write_bytes(b"same content")
+        store_file(str(store), str(tmp_path / name), str(view / name))
+
+    assert len(list_blobs(str(store))) == 1
+    assert (view / "a.png").read_bytes() == b"same content"
+    assert os.path.samefile(view / "a.png", view / "b.png")
+
+
+def test_collect_garbage_keeps_referenced_blobs(tmp_path):
+    store = tmp_path / "blobs"
+    view = tmp_path / "view"
+    view.mkdir()
+    for name in ["kept.png", "removed.png"]:
+        (tmp_path / name).write_bytes(name.encode())
+        store_file(str(store), str(tmp_path / name), str(view / name))
+    os.remove(view / "removed.png")
+
+    report = collect_garbage(str(store), [str(view)])
+
+    assert report == {"removed": 1, "freed_bytes": len(b"removed.png")}
+    assert len(list_blobs(str(store))) == 1
+    assert (view / "kept.png").read_bytes() == b"kept.png"
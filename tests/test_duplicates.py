@@ -0,0 +1,97 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("yaml")
+
+from scripts.manage_data import (  # noqa: E402
+    compute_dhash,
+    find_duplicate_clusters,
+    split_data,
+)
+
+
+def test_find_duplicate_clusters():
+    hashes = {
+        "a": 0,
+        "b": 0b1111,  # 4 bits from a
+        "c": 0b1111 << 60,  # 4 bits from a, every chunk of a differs from b
+        "d": (1 << 64) - 1,
+        "e": ((1 << 64) - 1) ^ (1 << 40),  # 1 bit from d
+        "f": 0xAAAAAAAAAAAAAAAA,
+    }
+
+    clusters = find_duplicate_clusters(hashes, max_distance=4)
+
+    assert clusters == [["a", "b", "c"], ["d", "e"]]
+    assert find_duplicate_clusters(hashes, max_distance=0) == []
+
+
+def create_images(path, copies: dict) -> dict:
+    """
+    Create random images, some of them with near-identical copies, and one label file per image.
+    """
+    images_path = path / "images"
+    labels_path = path / "labels"
+    images_path.mkdir()
+    labels_path.mkdir()
+    rng = np.random.default_rng(0)
+    clusters = {}
+    for i, count in copies.items():
+        image = cv2.resize(
+            rng.integers(0, 256, (9, 9, 3), dtype=np.uint8),
+            (64, 64),
+            interpolation=cv2.INTER_NEAREST,
+        )
+        for j in range(count):
+            name = f"image_{i}_{j}"
+            # The copies differ in a few pixels, as a re-encoded frame would
+            image[0, j] = 255 - image[0, j]
+            cv2.imwrite(str(images_path / f"{name}.png"), image)
+            (labels_path / f"{name}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+            clusters.setdefault(i, []).append(name)
+    return clusters
+
+
+def find_subset(path, name: str) -> str:
+    for subset in ["train", "val", "test"]:
+        if os.path.exists(path / "images" / subset / f"{name}.png"):
+            assert os.path.exists(path / "labels" / subset / f"{name}.txt")
+            return subset
+    raise AssertionError(f"{name} was not moved")
+
+
+def test_split_data_never_cuts_a_cluster(tmp_path):
+    copies = {i: 3 if i % 4 == 0 else 1 for i in range(20)}
+    clusters = create_images(tmp_path, copies)
+    hashes = {
+        name: compute_dhash(str(tmp_path / "images" / f"{name}.png"))
+        for names in clusters.values()
+        for name in names
+    }
+    assert len(find_duplicate_clusters(hashes)) == 5
+
+    split_data(
+        str(tmp_path / "images"),
+        str(tmp_path / "labels"),
+        train_ratio=0.6,
+        duplicates="group",
+    )
+
+    subsets = set()
+    for names in clusters.values():
+        cluster_subsets = {find_subset(tmp_path, name) for name in names}
+        assert len(cluster_subsets) == 1
+        subsets |= cluster_subsets
+    assert subsets == {"train", "val", "test"}
+
+
+def test_split_data_rejects_unknown_duplicates_mode(tmp_path):
+    create_images(tmp_path, {0: 1})
+
+    with pytest.raises(ValueError):
+        split_data(
+            str(tmp_path / "images"), str(tmp_path / "labels"), duplicates="Group"
+        )
+    assert os.path.exists(tmp_path / "images" / "image_0_0.png")
@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+from scripts.evalute_datasets import (  # noqa: E402
+    box_sums,
+    score_masks,
+    summed_area_table,
+)
+
+
+def test_box_sums_match_pixel_sums():
+    rng = np.random.default_rng(0)
+    layer = rng.random((9, 13)) > 0.5
+    boxes = np.array([[0, 0, 13, 9], [2, 3, 7, 8], [4, 4, 4, 6], [12, 0, 13, 1]])
+
+    sums = box_sums(summed_area_table(layer)[None], boxes)[0]
+
+    expected = [layer[y1:y2, x1:x2].sum() for x1, y1, x2, y2 in boxes]
+    np.testing.assert_array_equal(sums, expected)
+
+
+def test_score_masks():
+    # Coordinates exactly representable in binary so the boxes fall on pixels
+    mask = np.zeros((128, 128), np.uint8)
+    mask[16:48, 16:48] = 255
+    mask[64:112, 64:112] = 255
+    mask[0:2, 126:128] = 255  # Below min_area, not a polyp
+    rows = np.array(
+        [
+            [0, 0.25, 0.25, 0.25, 0.25, 0.9],  # Exactly the first polyp
+            [0, 0.625, 0.625, 0.125, 0.125, 0.8],  # Inside the second, low coverage
+            [0, 0.75, 0.125, 0.0625, 0.0625, 0.7],  # On the background
+        ]
+    )
+
+    result = score_masks(mask, rows)
+
+    assert result["polyps"] == 2
+    assert result["boxes"] == 3
+    assert result["polyps_hit"] == 1
+    assert result["boxes_without_hit"] == 2
+    np.testing.assert_allclose(result["coverage"], [1.0, 256 / 2304])
+    np.testing.assert_allclose(result["precision"], [1.0, 1.0, 0.0])
+
+
+def test_score_masks_without_boxes_or_polyps():
+    result = score_masks(np.zeros((20, 20), np.uint8), np.zeros((0, 5)))
+
+    assert result["polyps"] == 0
+    assert result["boxes"] == 0
+    assert result["polyps_hit"] == 0
+    assert result["coverage"] == []
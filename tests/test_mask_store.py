@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("yaml")
+
+from scripts.mask_store import (  # noqa: E402
+    MaskStore,
+    build_mask_store,
+    open_masks,
+    read_mask,
+)
+
+
+def test_masks_round_trip(tmp_path):
+    masks_path = tmp_path / "masks"
+    masks_path.mkdir()
+    rng = np.random.default_rng(0)
+    # Odd sizes so the bits of a mask do not end on a byte boundary
+    masks = {
+        "image_1_mask": (rng.random((5, 7)) > 0.5).astype(np.uint8) * 255,
+        "image_2_mask": (rng.random((3, 3)) > 0.5).astype(np.uint8) * 255,
+    }
+    for name, mask in masks.items():
+        cv2.imwrite(str(masks_path / f"{name}.png"), mask)
+
+    store = MaskStore(build_mask_store(str(masks_path)))
+
+    assert len(store) == 2
+    assert store.names() == sorted(masks)
+    for name, mask in masks.items():
+        np.testing.assert_array_equal(store[name], mask > 0)
+    for stored, name in zip(store, store.names()):
+        np.testing.assert_array_equal(stored, masks[name] > 0)
+
+    # A directory of masks and a store are read the same way
+    directory = open_masks(str(masks_path))
+    for name, mask in masks.items():
+        np.testing.assert_array_equal(read_mask(directory, name) > 0, mask > 0)
+    assert read_mask(store, "missing") is None
+
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        MaskStore(str(tmp_path / "masks.mstore"))
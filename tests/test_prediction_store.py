@@ -0,0 +1,47 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("yaml")
+
+from scripts.prediction_store import (  # noqa: E402
+    PredictionStoreWriter,
+    export_prediction_store,
+    read_label_file,
+    read_prediction_store,
+)
+
+
+def test_round_trip_across_chunks_and_reopen(tmp_path):
+    store_path = str(tmp_path / "predictions.pstore")
+    with PredictionStoreWriter(store_path, chunk_rows=2) as store:
+        store.append("a", [0, 0], [0.9, 0.5], [[0.5, 0.5, 0.2, 0.2], [0.1] * 4])
+        store.append("empty", [], [], np.zeros((0, 4)))
+        store.append("b", [0], [0.7], [[0.3, 0.4, 0.1, 0.2]])
+    # A second writer continues the ids and rows of the store
+    with PredictionStoreWriter(store_path) as store:
+        store.append("c", [0], [0.6], [[0.6, 0.6, 0.3, 0.3]])
+
+    predictions = read_prediction_store(store_path)
+
+    assert list(predictions) == ["a", "empty", "b", "c"]
+    assert predictions["empty"].shape == (0, 6)
+    np.testing.assert_allclose(
+        predictions["a"], [[0, 0.5, 0.5, 0.2, 0.2, 0.9], [0, 0.1, 0.1, 0.1, 0.1, 0.5]]
+    )
+    np.testing.assert_allclose(predictions["c"], [[0, 0.6, 0.6, 0.3, 0.3, 0.6]])
+
+
+def test_export_matches_label_files(tmp_path):
+    store_path = str(tmp_path / "predictions.pstore")
+    with PredictionStoreWriter(store_path) as store:
+        store.append("a", [0], [0.9], [[0.5, 0.5, 0.2, 0.2]])
+        store.append("empty", [], [], np.zeros((0, 4)))
+
+    export_prediction_store(store_path, str(tmp_path / "labels"), save_conf=True)
+
+    assert not (tmp_path / "labels" / "empty.txt").exists()
+    np.testing.assert_allclose(
+        read_label_file(str(tmp_path / "labels" / "a.txt")),
+        [[0, 0.5, 0.5, 0.2, 0.2, 0.9]],
+    )
@@ -0,0 +1,43 @@
+import copy
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+YOLO = pytest.importorskip("ultralytics").YOLO
+
+
+def create_dataset(path) -> str:
+    """
+    Create a tiny dataset with one box per image and its yaml file.
+    """
+    for folder in ["images", "labels"]:
+        (path / folder).mkdir()
+    for i in range(4):
+        image = np.full((64, 64, 3), 80, np.uint8)
+        cv2.rectangle(image, (16, 16), (48, 48), (200, 200, 200), -1)
+        cv2.imwrite(str(path / "images" / f"image_{i}.jpg"), image)
+        (path / "labels" / f"image_{i}.txt").write_text("0 0.5 0.5 0.5 0.5\n")
+    yaml_path = path / "dataset.yaml"
+    yaml_path.write_text(
+        f"path: {path}\ntrain: images\nval: images\nnc: 1\nnames: ['polyp']\n"
+    )
+    return str(yaml_path)
+
+
+def test_prune_model_after_validation(tmp_path):
+    from scripts.pruning import prune_model
+
+    model = YOLO("yolo11n.yaml")
+    unfused = copy.deepcopy(model.model)
+    model.val(data=create_dataset(tmp_path), imgsz=64, device="cpu", plots=False)
+
+    # Validation fuses the model in place, the copy taken before can be pruned
+    with pytest.raises(ValueError):
+        prune_model(model.model, 0.5)
+    pruned = prune_model(unfused, 0.5)
+
+    parameters = sum(parameter.numel() for parameter in pruned.parameters())
+    assert parameters < sum(parameter.numel() for parameter in unfused.parameters())
+    with torch.inference_mode():
+        pruned.eval()(torch.zeros(1, 3, 64, 64))